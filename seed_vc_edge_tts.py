@@ -7,117 +7,363 @@ import yaml
 from hf_utils import load_custom_model_from_hf
 import numpy as np
 from pydub import AudioSegment
+import soundfile as sf
+import os
+import io
+import gc
+import base64
+import time
+import math
+import shutil
+import re
+import hashlib
+import uuid
+import threading
+import types
+import queue
+import json
+import csv
+import argparse
+import contextlib
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import subprocess
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from safetensors.torch import save_file, load_file
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
 
 # edge tts
 import asyncio
+import random
+import importlib
 import traceback
 import edge_tts
 
 # edge tts需要外网访问，这里设置你的网络代理
 edge_proxy = "http://192.168.31.69:7890"
 
-# Load model and configuration
+startup_time = time.time()
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-dit_checkpoint_path, dit_config_path = load_custom_model_from_hf("Plachta/Seed-VC",
-                                                                 "DiT_seed_v2_uvit_whisper_small_wavenet_bigvgan_pruned.pth",
-                                                                 "config_dit_mel_seed_uvit_whisper_small_wavenet.yml")
-config = yaml.safe_load(open(dit_config_path, 'r'))
-model_params = recursive_munch(config['model_params'])
-model = build_model(model_params, stage='DiT')
-hop_length = config['preprocess_params']['spect_params']['hop_length']
-sr = config['preprocess_params']['sr']
-
-# Load checkpoints
-model, _, _, _ = load_checkpoint(model, None, dit_checkpoint_path,
-                                 load_only_params=True, ignore_modules=[], is_distributed=False)
-for key in model:
-    model[key].eval()
-    model[key].to(device)
-model.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
-
-# Load additional modules
-from modules.campplus.DTDNN import CAMPPlus
-
-campplus_ckpt_path = load_custom_model_from_hf("funasr/campplus", "campplus_cn_common.bin", config_filename=None)
-campplus_model = CAMPPlus(feat_dim=80, embedding_size=192)
-campplus_model.load_state_dict(torch.load(campplus_ckpt_path, map_location="cpu"))
-campplus_model.eval()
-campplus_model.to(device)
-
-from modules.bigvgan import bigvgan
-
-bigvgan_model = bigvgan.BigVGAN.from_pretrained('nvidia/bigvgan_v2_22khz_80band_256x', use_cuda_kernel=False)
-
-# remove weight norm in the model and set to eval mode
-bigvgan_model.remove_weight_norm()
-bigvgan_model = bigvgan_model.eval().to(device)
-
-# whisper
-from transformers import AutoFeatureExtractor, WhisperModel
-
-whisper_name = model_params.speech_tokenizer.whisper_name if hasattr(model_params.speech_tokenizer,
-                                                                     'whisper_name') else "openai/whisper-small"
-whisper_model = WhisperModel.from_pretrained(whisper_name, torch_dtype=torch.float16).to(device)
-del whisper_model.decoder
-whisper_feature_extractor = AutoFeatureExtractor.from_pretrained(whisper_name)
-
-# Generate mel spectrograms
-mel_fn_args = {
-    "n_fft": config['preprocess_params']['spect_params']['n_fft'],
-    "win_size": config['preprocess_params']['spect_params']['win_length'],
-    "hop_size": config['preprocess_params']['spect_params']['hop_length'],
-    "num_mels": config['preprocess_params']['spect_params']['n_mels'],
-    "sampling_rate": sr,
-    "fmin": 0,
-    "fmax": None,
-    "center": False
-}
-from modules.audio import mel_spectrogram
-
-to_mel = lambda x: mel_spectrogram(x, **mel_fn_args)
-
-# f0 conditioned model
-dit_checkpoint_path, dit_config_path = load_custom_model_from_hf("Plachta/Seed-VC",
-                                                                 "DiT_seed_v2_uvit_whisper_base_f0_44k_bigvgan_pruned_ft_ema.pth",
-                                                                 "config_dit_mel_seed_uvit_whisper_base_f0_44k.yml")
-
-config = yaml.safe_load(open(dit_config_path, 'r'))
-model_params = recursive_munch(config['model_params'])
-model_f0 = build_model(model_params, stage='DiT')
-hop_length = config['preprocess_params']['spect_params']['hop_length']
-sr = config['preprocess_params']['sr']
-
-# Load checkpoints
-model_f0, _, _, _ = load_checkpoint(model_f0, None, dit_checkpoint_path,
-                                    load_only_params=True, ignore_modules=[], is_distributed=False)
-for key in model_f0:
-    model_f0[key].eval()
-    model_f0[key].to(device)
-model_f0.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
-
-# f0 extractor
-from modules.rmvpe import RMVPE
-
-model_path = load_custom_model_from_hf("lj1995/VoiceConversionWebUI", "rmvpe.pt", None)
-rmvpe = RMVPE(model_path, is_half=False, device=device)
-
-mel_fn_args_f0 = {
-    "n_fft": config['preprocess_params']['spect_params']['n_fft'],
-    "win_size": config['preprocess_params']['spect_params']['win_length'],
-    "hop_size": config['preprocess_params']['spect_params']['hop_length'],
-    "num_mels": config['preprocess_params']['spect_params']['n_mels'],
-    "sampling_rate": sr,
-    "fmin": 0,
-    "fmax": None,
-    "center": False
-}
-to_mel_f0 = lambda x: mel_spectrogram(x, **mel_fn_args_f0)
-bigvgan_44k_model = bigvgan.BigVGAN.from_pretrained('nvidia/bigvgan_v2_44khz_128band_512x', use_cuda_kernel=False)
-
-# remove weight norm in the model and set to eval mode
-bigvgan_44k_model.remove_weight_norm()
-bigvgan_44k_model = bigvgan_44k_model.eval().to(device)
+# CPU 推理优化，只在没有 GPU 时生效
+cpu_threads = None  # PyTorch intra-op 线程数，None 表示使用默认值
+cpu_quantize = []  # 使用动态 int8 量化的模型，可选 "whisper"、"dit"
+cpu_bf16 = False  # CPU 支持 bf16 时，whisper、扩散推理和 vocoder 使用 bf16
+cpu_compile = False  # 使用 torch.compile 编译 DiT 和 BigVGAN，首次推理时编译较慢
+cpu_channels_last = False  # RMVPE 和 CAMPPlus 的二维卷积使用 channels_last 内存格式
+if device.type == "cpu" and cpu_threads:
+    torch.set_num_threads(cpu_threads)
+
+# 模型按需加载：whisper/campplus 为公共模型，22k 为默认模型，f0_44k 为 F0 条件模型（含 44k BigVGAN 和 RMVPE）
+preload_models = ["common", "22k"]  # 启动后在后台预加载的模型，设为 [] 则全部在首次使用时加载
+max_loaded_models = 3  # 同时驻留的模型数量上限，超出时卸载最久未使用的模型
+model_idle_timeout = None  # 模型空闲超过该秒数后卸载，None 表示不卸载
+
+# 扩散推理合批：并发请求中模型、扩散步数和 CFG 相同的分块合并为一次批量推理
+cfm_max_batch_size = 4  # 每批最多合并的分块数量，设为 1 则不合批
+cfm_max_wait = 0.01  # 等待凑批的最长时间（秒）
+request_concurrency = 4  # 界面同时处理的请求数量（多进程服务时为每个推理进程同时处理的请求数量）
+
+# 多进程服务：界面进程只负责分发请求，由多个推理进程完成推理
+# 推理进程中模型首次加载后 state_dict 保存到 shared_weights_dir，之后各进程以 mmap 方式加载，CPU 上多个进程共用页缓存中的同一份权重
+# 单进程推理时不保存共享权重
+serve_workers = 0  # 推理进程数量，0 表示在界面进程中推理
+shared_weights_dir = "./checkpoints/shared_weights"  # None 表示不保存共享权重
+worker_affinity_slack = 2  # 已缓存该音色或已加载该模型的进程，排队数不超过最空闲进程加上该值时优先分配给它
+worker_max_start_failures = 3  # 推理进程连续这么多次在就绪前退出（如模型加载失败）后不再重启
+
+
+def cpu_bf16_enabled():
+    return (device.type == "cpu" and cpu_bf16 and torch.backends.mkldnn.is_available()
+            and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+
+
+def whisper_dtype():
+    if device.type == "cuda":
+        return torch.float16
+    # 动态量化需要 fp32 权重
+    if "whisper" in cpu_quantize:
+        return torch.float32
+    return torch.bfloat16 if cpu_bf16_enabled() else torch.float32
+
+
+def autocast_context(vocoder=False):
+    # cuda 上扩散推理使用 fp16，vocoder 保持 fp32；cpu 上开启 cpu_bf16 时都使用 bf16，否则使用 fp32
+    if device.type == "cuda":
+        return torch.autocast(device_type="cuda", dtype=torch.float16, enabled=not vocoder)
+    return torch.autocast(device_type="cpu", dtype=torch.bfloat16, enabled=cpu_bf16_enabled())
+
+
+def optimize_common_models(common_models):
+    if device.type != "cpu":
+        return common_models
+    whisper_model = common_models["whisper_model"]
+    if "whisper" in cpu_quantize:
+        whisper_model.encoder = torch.ao.quantization.quantize_dynamic(whisper_model.encoder, {torch.nn.Linear},
+                                                                        dtype=torch.qint8)
+    if cpu_channels_last:
+        common_models["campplus_model"].to(memory_format=torch.channels_last)
+    return common_models
+
+
+def optimize_vc_models(vc_models):
+    if device.type != "cpu":
+        return vc_models
+    estimator = vc_models["model"].cfm.estimator
+    if "dit" in cpu_quantize:
+        torch.ao.quantization.quantize_dynamic(estimator, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if cpu_compile:
+        estimator.compile(dynamic=True)
+        vc_models["bigvgan_model"].compile(dynamic=True)
+    if cpu_channels_last and "rmvpe" in vc_models:
+        vc_models["rmvpe"].model.to(memory_format=torch.channels_last)
+    return vc_models
+
+
+worker_process = False  # serve_worker 中设为 True
+
+
+def hf_snapshot(repo_id):
+    # 本地快照目录名为上游的提交哈希，上游模型更新后随之变化
+    from huggingface_hub import hf_hub_download
+    return os.path.dirname(hf_hub_download(repo_id, "config.json"))
+
+
+model_sources = {}  # 模型名称 -> 模型文件、上游版本和精度的摘要，共享权重和音色磁盘缓存按它区分
+
+
+def shared_weights_path(name, source, hub_repos=()):
+    # 模型文件、上游版本或精度变化时使用新的文件
+    source = ":".join([source, *(hf_snapshot(repo_id) for repo_id in hub_repos)])
+    model_sources[name] = hashlib.md5(source.encode()).hexdigest()[:12]
+    if shared_weights_dir is None or not worker_process:
+        return None
+    return os.path.join(shared_weights_dir, f"{name}_{model_sources[name]}.pt")
+
+
+def load_shared_weights(path):
+    if path is None or not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+
+def share_weights(path, modules, shared):
+    # shared 为 None 时先保存当前权重；cpu 上用 mmap 中的张量直接替换模块参数（不复制），进程自己的那份随即释放
+    if path is None:
+        return
+    if shared is None:
+        os.makedirs(shared_weights_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save({key: module.state_dict() for key, module in modules.items()}, tmp_path)
+        os.replace(tmp_path, path)
+        shared = load_shared_weights(path)
+    for key, module in modules.items():
+        module.load_state_dict(shared[key], assign=device.type == "cpu")
+
+
+def load_common_models():
+    from modules.campplus.DTDNN import CAMPPlus
+    from transformers import AutoConfig, AutoFeatureExtractor, AutoModel, WhisperModel
+
+    campplus_ckpt_path = load_custom_model_from_hf("funasr/campplus", "campplus_cn_common.bin", config_filename=None)
+    # whisper，22k 与 f0_44k 模型共用 whisper-small 语义特征
+    whisper_name = "openai/whisper-small"
+    weights_path = shared_weights_path("common", f"{campplus_ckpt_path}:{whisper_dtype()}", [whisper_name])
+    shared = load_shared_weights(weights_path)
+
+    campplus_model = CAMPPlus(feat_dim=80, embedding_size=192)
+    if shared is None:
+        campplus_model.load_state_dict(torch.load(campplus_ckpt_path, map_location="cpu"))
+    campplus_model.eval()
+    campplus_model.to(device)
+
+    if shared is None:
+        whisper_model = WhisperModel.from_pretrained(whisper_name, torch_dtype=whisper_dtype()).to(device)
+    else:
+        # 已有共享权重时只按配置构建模型结构
+        whisper_model = AutoModel.from_config(AutoConfig.from_pretrained(whisper_name),
+                                              torch_dtype=whisper_dtype()).eval().to(device)
+    del whisper_model.decoder
+    whisper_feature_extractor = AutoFeatureExtractor.from_pretrained(whisper_name)
+    share_weights(weights_path, {"campplus_model": campplus_model, "whisper_model": whisper_model}, shared)
+    return optimize_common_models({"campplus_model": campplus_model, "whisper_model": whisper_model,
+                                   "whisper_feature_extractor": whisper_feature_extractor})
+
+
+def load_vc_models(f0_condition):
+    from modules.bigvgan import bigvgan
+    from modules.audio import mel_spectrogram
+    from huggingface_hub import hf_hub_download
+
+    if not f0_condition:
+        dit_checkpoint_path, dit_config_path = load_custom_model_from_hf("Plachta/Seed-VC",
+                                                                         "DiT_seed_v2_uvit_whisper_small_wavenet_bigvgan_pruned.pth",
+                                                                         "config_dit_mel_seed_uvit_whisper_small_wavenet.yml")
+        bigvgan_name = 'nvidia/bigvgan_v2_22khz_80band_256x'
+    else:
+        # f0 conditioned model
+        dit_checkpoint_path, dit_config_path = load_custom_model_from_hf("Plachta/Seed-VC",
+                                                                         "DiT_seed_v2_uvit_whisper_base_f0_44k_bigvgan_pruned_ft_ema.pth",
+                                                                         "config_dit_mel_seed_uvit_whisper_base_f0_44k.yml")
+        bigvgan_name = 'nvidia/bigvgan_v2_44khz_128band_512x'
+    config = yaml.safe_load(open(dit_config_path, 'r'))
+    model_params = recursive_munch(config['model_params'])
+    model = build_model(model_params, stage='DiT')
+    sr = config['preprocess_params']['sr']
+    weights_path = shared_weights_path(vc_model_name(f0_condition), dit_checkpoint_path, [bigvgan_name])
+    shared = load_shared_weights(weights_path)
+
+    # Load checkpoints
+    if shared is None:
+        model, _, _, _ = load_checkpoint(model, None, dit_checkpoint_path,
+                                         load_only_params=True, ignore_modules=[], is_distributed=False)
+    for key in model:
+        model[key].eval()
+        model[key].to(device)
+    # 开启 CFG 时每个请求占两行
+    model.cfm.estimator.setup_caches(max_batch_size=2 * cfm_max_batch_size, max_seq_length=8192)
+    if hasattr(model.cfm.estimator, "wavenet"):
+        install_rowwise_wavenet(model.cfm.estimator.wavenet)
+
+    # Generate mel spectrograms
+    mel_fn_args = {
+        "n_fft": config['preprocess_params']['spect_params']['n_fft'],
+        "win_size": config['preprocess_params']['spect_params']['win_length'],
+        "hop_size": config['preprocess_params']['spect_params']['hop_length'],
+        "num_mels": config['preprocess_params']['spect_params']['n_mels'],
+        "sampling_rate": sr,
+        "fmin": 0,
+        "fmax": None,
+        "center": False
+    }
+    to_mel = lambda x: mel_spectrogram(x, **mel_fn_args)
+
+    if shared is None:
+        bigvgan_model = bigvgan.BigVGAN.from_pretrained(bigvgan_name, use_cuda_kernel=False)
+    else:
+        bigvgan_model = bigvgan.BigVGAN(bigvgan.load_hparams_from_json(hf_hub_download(bigvgan_name, "config.json")),
+                                        use_cuda_kernel=False)
+    # remove weight norm in the model and set to eval mode
+    bigvgan_model.remove_weight_norm()
+    bigvgan_model = bigvgan_model.eval().to(device)
+
+    vc_models = {"model": model, "to_mel": to_mel, "bigvgan_model": bigvgan_model}
+    shared_modules = {f"model.{key}": model[key] for key in model}
+    shared_modules["bigvgan_model"] = bigvgan_model
+    if f0_condition:
+        # f0 extractor
+        from modules.rmvpe import RMVPE
+
+        model_path = load_custom_model_from_hf("lj1995/VoiceConversionWebUI", "rmvpe.pt", None)
+        vc_models["rmvpe"] = RMVPE(model_path, is_half=False, device=device)
+        shared_modules["rmvpe"] = vc_models["rmvpe"].model
+    share_weights(weights_path, shared_modules, shared)
+    return optimize_vc_models(vc_models)
+
+
+def install_rowwise_wavenet(wavenet):
+    # wavenet 的卷积在序列末尾使用反射填充，合批补零会改变边界处的结果，这里按每行的实际长度分别计算
+    def rowwise_forward(self, x, x_mask, g=None, **kwargs):
+        lengths = x_mask.sum(dim=-1).flatten().long().tolist()
+        if min(lengths) == x.size(-1):
+            return self.batched_forward(x, x_mask, g=g, **kwargs)
+        output = torch.zeros_like(x)
+        for b, length in enumerate(lengths):
+            output[b:b + 1, :, :length] = self.batched_forward(x[b:b + 1, :, :length], x_mask[b:b + 1, :, :length],
+                                                                g=None if g is None else g[b:b + 1], **kwargs)
+        return output
+
+    wavenet.batched_forward = wavenet.forward
+    wavenet.forward = types.MethodType(rowwise_forward, wavenet)
+
+
+class ModelRegistry:
+    def __init__(self, loaders, max_loaded=None, idle_timeout=None):
+        self.loaders = loaders
+        self.max_loaded = max_loaded
+        self.idle_timeout = idle_timeout
+        self.models = OrderedDict()
+        self.last_used = {}
+        # 每组模型的首次加载（冷启动）和最近一次重新加载（卸载后再次加载，文件通常已在页缓存中）耗时
+        self.load_times = {}
+        self.lock = threading.Lock()
+        self.load_locks = {name: threading.Lock() for name in loaders}
+        if idle_timeout is not None:
+            threading.Thread(target=self._unload_idle_loop, daemon=True).start()
+
+    def get(self, name):
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                self.last_used[name] = time.time()
+                return self.models[name]
+        with self.load_locks[name]:
+            with self.lock:
+                loaded = self.models.get(name)
+            if loaded is None:
+                start_time = time.time()
+                with stage_timer("model_load"):
+                    loaded = self.loaders[name]()
+                times = self.load_times.setdefault(name, {"cold": None, "warm": None, "reloads": 0})
+                kind = "cold" if times["cold"] is None else "warm"
+                times[kind] = time.time() - start_time
+                times["reloads"] += kind == "warm"
+                print(f"[models] {name} loaded in {times[kind]:.2f}s ({kind})")
+            with self.lock:
+                self.models[name] = loaded
+                self.models.move_to_end(name)
+                self.last_used[name] = time.time()
+                evicted = []
+                while self.max_loaded is not None and len(self.models) > self.max_loaded:
+                    evicted.append(self.models.popitem(last=False)[0])
+            for old_name in evicted:
+                self._release(old_name)
+            return loaded
+
+    def is_loaded(self, name):
+        with self.lock:
+            return name in self.models
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+
+    def unload(self, name):
+        with self.lock:
+            if self.models.pop(name, None) is None:
+                return
+        self._release(name)
+
+    def _release(self, name):
+        # 正在进行的请求仍持有模型引用，请求结束后内存才会释放
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"[models] {name} unloaded")
+
+    def _unload_idle_loop(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 60))
+            with self.lock:
+                idle = [name for name in self.models if time.time() - self.last_used[name] > self.idle_timeout]
+            for name in idle:
+                self.unload(name)
+
+
+def vc_model_name(f0_condition):
+    return "f0_44k" if f0_condition else "22k"
+
+
+models = ModelRegistry({
+    "common": load_common_models,
+    "22k": lambda: load_vc_models(False),
+    "f0_44k": lambda: load_vc_models(True),
+}, max_loaded=max_loaded_models, idle_timeout=model_idle_timeout)
 
 
 def adjust_f0_semitones(f0_sequence, n_semitones):
@@ -137,141 +383,1173 @@ def crossfade(chunk1, chunk2, overlap):
 
 # streaming and chunk processing related params
 overlap_frame_len = 16
+# 每个分块都会带上参考音频的提示部分一起推理，提示越长，每步计算量越大，留给源音频的窗口越小
+# 设置后只用参考音频的前 max_prompt_seconds 秒作为提示，音色向量和 F0 统计仍使用完整参考音频；None 表示使用完整参考（最长 25 秒）
+max_prompt_seconds = None
+# 分块大小：第一块只有 first_chunk_seconds 秒，之后每块按 chunk_growth 倍增长，直到上下文窗口上限
+# 第一段音频更快输出，后面的大块保持吞吐量；first_chunk_seconds 为 0 时每块都使用最大窗口
+first_chunk_seconds = 2.0
+chunk_growth = 2.0
 bitrate = "320k"
+opus_bitrate = "128k"
+stream_drain_time = 0.02
 
 
-@torch.no_grad()
-@torch.inference_mode()
-def voice_conversion(tts_text, tts_choice, speed, pitch, target, diffusion_steps, length_adjust, inference_cfg_rate,
-                     f0_condition,
-                     auto_f0_adjust,
-                     pitch_shift):
-    print(length_adjust)
-    edge_audio = None
-    speed_str = f"{speed:+d}%"
-    pitch_str = f"{pitch:+d}Hz"
+# 性能统计：记录每个请求各阶段的耗时和显存变化，请求结束时输出一行 JSON，并通过 metrics_port 提供汇总数据
+metrics_enabled = True
+# 各阶段前后同步 GPU，GPU 阶段的计时才准确；同步会等待所有请求的 GPU 任务，并发请求互相拖慢，只在分析性能时开启
+metrics_cuda_sync = False
+metrics_host = "127.0.0.1"  # 统计接口只在本机访问，设为 "0.0.0.0" 则对外开放
+metrics_port = 7861  # 统计接口 http://localhost:7861/metrics，None 表示不启动
+metrics_log_file = None  # 每个请求的统计追加写入该 JSONL 文件，None 表示只打印
+
+current_metrics = contextvars.ContextVar("current_metrics", default=None)
+recent_metrics = deque(maxlen=1000)
+metrics_sink = None  # 推理进程把每个请求的统计转发给界面进程
+
+
+class RequestMetrics:
+    def __init__(self, **info):
+        self.info = info
+        self.start_time = time.time()
+        self.first_chunk_time = None
+        self.audio_seconds = 0.0
+        self.stages = {}
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, memory=None):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if memory is not None:
+                self.memory[stage] = max(self.memory.get(stage, memory), memory)
+
+    def chunk(self, output_wave, sr):
+        if self.first_chunk_time is None:
+            self.first_chunk_time = time.time()
+        self.audio_seconds += len(output_wave) / sr
+
+    def summary(self, status="ok"):
+        total_time = time.time() - self.start_time
+        return {
+            **self.info,
+            "status": status,
+            "total_time": round(total_time, 4),
+            "time_to_first_chunk": None if self.first_chunk_time is None else round(
+                self.first_chunk_time - self.start_time, 4),
+            "audio_seconds": round(self.audio_seconds, 3),
+            "rtf": round(total_time / self.audio_seconds, 4) if self.audio_seconds > 0 else None,
+            # 请求排队（接口并发上限、推理进程队列）与扩散合批排队之和，不含 Gradio 队列
+            "queue_wait": round(self.stages.get("request_queue_wait", 0.0) + self.stages.get("cfm_queue_wait", 0.0), 4),
+            "stages": {k: round(v, 4) for k, v in self.stages.items()},
+            "memory_delta_mb": {k: round(v, 1) for k, v in self.memory.items()},
+        }
+
+
+def memory_mb():
+    # 进程启动以来的内存峰值（GPU 为显存峰值）
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 2 ** 20
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+
+def allocated_memory_mb():
+    # 当前分配的显存；CPU 上为进程当前的常驻内存（/proc/self/statm），无法读取时返回 None
+    if torch.cuda.is_available():
+        return torch.cuda.memory_allocated() / 2 ** 20
     try:
-        print(tts_choice)
-        asyncio.run(
-            edge_tts.Communicate(
-                tts_text, "-".join(tts_choice.split("-")[:-1]), rate=speed_str, pitch=pitch_str, proxy=edge_proxy
-            ).save(edge_output_filename)
-        )
-        edge_audio = gr.Audio(value=edge_output_filename)
-    except EOFError:
-        yield None, None, None
-    except:
-        info = traceback.format_exc()
-        print(info)
-        yield None, None, None
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    if metrics_cuda_sync and torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start_memory = allocated_memory_mb()
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        if metrics_cuda_sync and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        # 阶段前后已分配显存（CPU 上为常驻内存）的差值，不重置全局的峰值计数；并发请求的分配也会计入
+        end_memory = allocated_memory_mb()
+        metrics.add(stage, time.time() - start_time, None if start_memory is None else end_memory - start_memory)
+
+
+def log_request_metrics(metrics, status="ok"):
+    summary = metrics.summary(status)
+    recent_metrics.append(summary)
+    if metrics_sink is not None:
+        metrics_sink(summary)
+    line = json.dumps(summary, ensure_ascii=False)
+    print(f"[metrics] {line}")
+    if metrics_log_file is not None:
+        with open(metrics_log_file, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def metrics_snapshot():
+    completed = [m for m in recent_metrics if m["status"] == "ok"]
+    stage_names = sorted({stage for m in completed for stage in m["stages"]})
+
+    def values(key):
+        return [m[key] for m in completed if m[key] is not None]
+
+    return {
+        "uptime": round(time.time() - startup_time, 1),
+        "requests": len(recent_metrics),
+        "failed_requests": len(recent_metrics) - len(completed),
+        "time_to_first_chunk_p50": percentile(values("time_to_first_chunk"), 50),
+        "time_to_first_chunk_p99": percentile(values("time_to_first_chunk"), 99),
+        "request_latency_p50": percentile(values("total_time"), 50),
+        "request_latency_p99": percentile(values("total_time"), 99),
+        "rtf_p50": percentile(values("rtf"), 50),
+        "queue_wait_p50": percentile(values("queue_wait"), 50),
+        "queue_wait_p99": percentile(values("queue_wait"), 99),
+        "stage_mean": {stage: float(np.mean([m["stages"].get(stage, 0.0) for m in completed]))
+                       for stage in stage_names},
+        "cfm": cfm_scheduler.stats(),
+        "loaded_models": list(models.models),
+        "model_load_times": {name: dict(times) for name, times in models.load_times.items()},
+        "workers": worker_pool.stats() if worker_pool is not None else None,
+        "edge_tts": edge_tts_client.stats(),
+    }
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = json.dumps(metrics_snapshot(), ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer((metrics_host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[metrics] serving http://{metrics_host}:{port}/metrics")
+    return server
 
-    inference_module = model if not f0_condition else model_f0
-    mel_fn = to_mel if not f0_condition else to_mel_f0
-    bigvgan_fn = bigvgan_model if not f0_condition else bigvgan_44k_model
+
+# 参考音色缓存：按参考音频内容和模型类型缓存提示特征，常用音色无需重复提取
+voice_cache_dir = "./checkpoints/voice_cache"  # 设为 None 则只使用内存缓存
+voice_cache_size = 32  # 内存中最多保留的音色数量
+voice_cache_max_disk_bytes = 1024 * 1024 * 1024  # 磁盘缓存的大小上限，超出时删除最久未使用的文件
+voice_features_version = 2  # 提示特征的计算方式或格式变化时加一，旧的磁盘缓存随之失效
+
+
+class VoiceCache:
+    def __init__(self, max_size, cache_dir=None, max_disk_bytes=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = voice_cache_max_disk_bytes if max_disk_bytes is None else max_disk_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.safetensors")
+
+    def _remember(self, key, features):
+        with self.lock:
+            self.entries[key] = features
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.cache_dir is None or not os.path.exists(self._path(key)):
+            return None
+        # safetensors 以内存映射方式读取磁盘缓存；文件可能刚被其他进程清理
+        try:
+            features = {k: v.to(device) for k, v in load_file(self._path(key)).items()}
+            # 更新修改时间，清理时按最久未使用删除
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        self._remember(key, features)
+        return features
+
+    def put(self, key, features):
+        features = {k: v for k, v in features.items() if v is not None}
+        self._remember(key, features)
+        if self.cache_dir is not None:
+            # 目录由多个推理进程共用，临时文件名包含进程号
+            tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            save_file({k: v.contiguous().cpu() for k, v in features.items()}, tmp_path)
+            os.replace(tmp_path, self._path(key))
+            self._prune()
+
+    def _prune(self):
+        # 每次写入后扫描目录，其他进程写入的文件也计入；未命中时才会写入，扫描的开销相对特征提取可以忽略
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                # 写入中途退出留下的临时文件
+                if time.time() - stat.st_mtime > 3600:
+                    self._remove(path)
+            elif name.endswith(".safetensors"):
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files[:-1]:
+            if total_bytes <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+voice_cache = VoiceCache(voice_cache_size, voice_cache_dir)
+
+
+# edge tts 合成缓存：按 (文本, 音色, 语速, 音调) 缓存合成结果，重复的文本和重试不再访问网络
+edge_tts_cache_dir = "./checkpoints/edge_tts_cache"
+edge_tts_cache_max_bytes = 256 * 1024 * 1024  # 内存中缓存的 mp3 总大小上限
+edge_tts_cache_max_disk_bytes = 1024 * 1024 * 1024  # 磁盘上缓存的 mp3 总大小上限
+
+
+class EdgeTTSCache:
+    def __init__(self, max_bytes, cache_dir, max_disk_bytes):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # 磁盘上的文件按最近使用顺序记录大小，重启后从目录中恢复，超过上限时删除最旧的
+        self.files = OrderedDict()
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def _index(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp"):
+                # 上次退出时未写完的文件；目录由多个推理进程共用，较新的可能正在被其他进程写入
+                if time.time() - os.path.getmtime(path) > 3600:
+                    os.remove(path)
+            elif name.endswith(".mp3"):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-len(".mp3")], stat.st_size))
+        for _, key, size in sorted(files):
+            self.files[key] = size
+            self.disk_bytes += size
+        self._prune_files()
+
+    def _prune_files(self):
+        while self.disk_bytes > self.max_disk_bytes and len(self.files) > 1:
+            old_key, old_size = self.files.popitem(last=False)
+            self.disk_bytes -= old_size
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+
+    def _remember(self, key, audio_bytes):
+        if key not in self.entries:
+            self.entries[key] = audio_bytes
+            self.total_bytes += len(audio_bytes)
+        self.entries.move_to_end(key)
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, old_bytes = self.entries.popitem(last=False)
+            self.total_bytes -= len(old_bytes)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                # 磁盘上限小于内存上限时，文件可能已被删除而内存中仍保留
+                if key in self.files:
+                    self.files.move_to_end(key)
+                return self.entries[key]
+            if key not in self.files:
+                return None
+            self.files.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                audio_bytes = f.read()
+        except OSError:
+            return None
+        with self.lock:
+            self._remember(key, audio_bytes)
+        return audio_bytes
+
+    def put(self, key, audio_bytes):
+        # 每个请求对应一个按内容命名的文件，用于界面预览和重启后复用，并发请求之间不会互相覆盖
+        path = self.path(key)
+        if not os.path.exists(path):
+            tmp_path = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio_bytes)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self._remember(key, audio_bytes)
+            if key not in self.files:
+                self.files[key] = len(audio_bytes)
+                self.disk_bytes += len(audio_bytes)
+            self.files.move_to_end(key)
+            self._prune_files()
+
+
+edge_tts_cache = EdgeTTSCache(edge_tts_cache_max_bytes, edge_tts_cache_dir, edge_tts_cache_max_disk_bytes)
+
+
+# Edge TTS 客户端：所有请求在一个常驻的事件循环线程中进行，限制同时请求数，单次请求超时后按指数退避重试
+edge_tts_concurrency = 8  # 同时进行的 Edge TTS 请求数量
+edge_tts_timeout = 20  # 单次请求超时（秒）
+edge_tts_retries = 2  # 失败后的重试次数
+edge_tts_backoff = 0.5  # 第 n 次重试前等待约 backoff * 2^n 秒
+edge_tts_segment_chars = 300  # 超过该长度的文本按句分成多段并行请求，再按顺序拼接
+edge_tts_prefetch = 4  # 分句流水线中每个请求最多提前请求的句子数
+edge_tts_url = None  # 替换 Edge TTS 的 websocket 地址，例如本地测试服务 "ws://127.0.0.1:8765/tts?"
+edge_tts_voices_url = None  # 替换音色列表地址
+edge_tts_voices_file = "./checkpoints/edge_tts_voices.json"  # 音色列表缓存
+edge_tts_voices_max_age = 7 * 24 * 3600  # 音色列表缓存的有效期（秒）
+
+
+def edge_tts_cache_key(text, voice, rate, pitch):
+    return hashlib.sha256("\0".join([text, voice, rate, pitch]).encode("utf-8")).hexdigest()
+
+
+async def edge_tts_stream(text, voice, rate, pitch):
+    audio = bytearray()
+    async for chunk in edge_tts.Communicate(text, voice, rate=rate, pitch=pitch, proxy=edge_proxy).stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+    return bytes(audio)
+
+
+cjk_char_pattern = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def join_tts_text(left, right):
+    # 分句时去掉了句间空白，中日韩文字之间直接拼接，其余（如英文句子之间）用一个空格分隔
+    if cjk_char_pattern.match(left[-1:]) or cjk_char_pattern.match(right[:1]):
+        return left + right
+    return left + " " + right
+
+
+def edge_tts_text_segments(text, max_chars):
+    # 按句切分后把相邻的句子合并到 max_chars 以内，减少请求数量
+    segments = []
+    for sentence in split_tts_text(text, max_chars):
+        if segments and len(join_tts_text(segments[-1], sentence)) <= max_chars:
+            segments[-1] = join_tts_text(segments[-1], sentence)
+        else:
+            segments.append(sentence)
+    return segments
+
+
+class EdgeTTSClient:
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.loop = asyncio.new_event_loop()
+        self.latencies = deque(maxlen=1000)
+        self.counts = {"requests": 0, "segments": 0, "retries": 0, "timeouts": 0, "failures": 0, "in_flight": 0}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.loop.run_forever, name="edge-tts", daemon=True).start()
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    async def _fetch(self, text, voice, rate, pitch):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        for attempt in range(edge_tts_retries + 1):
+            try:
+                async with self.semaphore:
+                    self._count("in_flight")
+                    start_time = time.time()
+                    try:
+                        audio_bytes = await asyncio.wait_for(edge_tts_stream(text, voice, rate, pitch),
+                                                             edge_tts_timeout)
+                    finally:
+                        self._count("in_flight", -1)
+                with self.lock:
+                    self.latencies.append(time.time() - start_time)
+                return audio_bytes
+            except (ValueError, TypeError):
+                # 音色、语速等参数错误，重试没有意义
+                raise
+            except Exception as e:
+                self._count("timeouts" if isinstance(e, asyncio.TimeoutError) else "failures")
+                if attempt == edge_tts_retries:
+                    raise
+                self._count("retries")
+                print(f"[edge_tts] {type(e).__name__}: {e}, retry {attempt + 1}/{edge_tts_retries}")
+                await asyncio.sleep(edge_tts_backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+
+    async def _synthesize(self, text, voice, rate, pitch, metrics):
+        self.apply_urls()
+        start_time = time.time()
+        segments = edge_tts_text_segments(text, edge_tts_segment_chars) if len(text) > edge_tts_segment_chars else [text]
+        self._count("requests")
+        self._count("segments", len(segments))
+        tasks = [asyncio.ensure_future(self._fetch(segment, voice, rate, pitch)) for segment in segments]
+        try:
+            audio_bytes = b"".join(await asyncio.gather(*tasks))
+        finally:
+            # 某一段失败或请求被取消时，其余段不再请求
+            for task in tasks:
+                task.cancel()
+        if metrics is not None:
+            metrics.add("edge_tts", time.time() - start_time)
+        return audio_bytes
+
+    def submit(self, text, voice, rate, pitch, metrics=None):
+        # 返回 concurrent.futures.Future，cancel() 会取消事件循环中的请求
+        return asyncio.run_coroutine_threadsafe(self._synthesize(text, voice, rate, pitch, metrics), self.loop)
+
+    def run(self, coroutine, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # 超时或调用方被中断时取消事件循环中的任务，避免协程在后台继续运行
+            future.cancel()
+            raise
+
+    @staticmethod
+    def apply_urls():
+        if edge_tts_url is not None:
+            edge_tts.communicate.WSS_URL = edge_tts_url
+        if edge_tts_voices_url is not None:
+            importlib.import_module("edge_tts.list_voices").VOICE_LIST = edge_tts_voices_url
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            return {**self.counts, "latency_p50": percentile(latencies, 50), "latency_p99": percentile(latencies, 99)}
+
+
+edge_tts_client = EdgeTTSClient(edge_tts_concurrency)
+
+
+def edge_tts_submit(text, voice, rate, pitch):
+    # 返回 (key, future)，命中缓存时 future 已经完成
+    key = edge_tts_cache_key(text, voice, rate, pitch)
+    audio_bytes = edge_tts_cache.get(key)
+    if audio_bytes is not None:
+        future = Future()
+        future.set_result(audio_bytes)
+        return key, future
+    return key, edge_tts_client.submit(text, voice, rate, pitch, current_metrics.get())
+
+
+def edge_tts_synthesize(text, voice, rate, pitch):
+    key, future = edge_tts_submit(text, voice, rate, pitch)
+    audio_bytes = future.result()
+    edge_tts_cache.put(key, audio_bytes)
+    return key, audio_bytes
+
+
+def load_tts_speakers():
+    # 只读取缓存文件（不论是否过期），没有缓存时使用默认音色，不在界面启动时等待网络
+    voices = None
+    if os.path.exists(edge_tts_voices_file):
+        try:
+            with open(edge_tts_voices_file, encoding="utf-8") as f:
+                voices = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[edge_tts] failed to read voice list: {type(e).__name__}: {e}")
+    if not voices:
+        return tts_speakers
+    return [f"{v['ShortName']}-{v['Gender']}" for v in voices]
+
+
+def refresh_tts_speakers():
+    # 音色列表缓存过期或不存在时从 Edge TTS 获取并写入缓存文件，在后台线程中运行
+    if os.path.exists(edge_tts_voices_file) and \
+            time.time() - os.path.getmtime(edge_tts_voices_file) < edge_tts_voices_max_age:
+        return
+    try:
+        edge_tts_client.apply_urls()
+        voices = edge_tts_client.run(edge_tts.list_voices(proxy=edge_proxy), timeout=edge_tts_timeout)
+        os.makedirs(os.path.dirname(edge_tts_voices_file), exist_ok=True)
+        tmp_path = f"{edge_tts_voices_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(voices, f, ensure_ascii=False)
+        os.replace(tmp_path, edge_tts_voices_file)
+        print(f"[edge_tts] voice list updated: {len(voices)} voices")
+    except Exception as e:
+        print(f"[edge_tts] failed to fetch voice list: {type(e).__name__}: {e}")
+
+
+def voice_cache_key(target, f0_condition):
+    # 参考音频内容和模型类型，推理进程的音色亲和性也按它区分
+    variant = vc_model_name(f0_condition)
+    h = hashlib.sha256(variant.encode())
+    with open(target, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return f"{variant}_{h.hexdigest()}"
+
+
+# 音频前端：每段音频按原始采样率只解码一次，16k、22.05k、44.1k 由预先构建的重采样器得到
+# 重采样器按 (原采样率, 目标采样率) 缓存，卷积核只计算一次；同一段音频的每个采样率只重采样一次
+# torchaudio 的卷积核大小约为 (new/gcd) × (orig/gcd)，互质的采样率（如 16001 → 16000）会占满内存，
+# 约分后超过 resampler_max_terms 的采样率组合改用 librosa（soxr），不缓存
+resampler_max_terms = 1024
+resampler_cache_size = 16
+resamplers = OrderedDict()
+resamplers_lock = threading.Lock()
+
+
+def get_resampler(orig_sr, new_sr):
+    # 返回缓存的 torchaudio 重采样器，采样率组合不适合时返回 None
+    g = math.gcd(orig_sr, new_sr)
+    if max(orig_sr // g, new_sr // g) > resampler_max_terms:
+        return None
+    with resamplers_lock:
+        resampler = resamplers.get((orig_sr, new_sr))
+        if resampler is None:
+            resampler = torchaudio.transforms.Resample(orig_sr, new_sr).to(device)
+            resamplers[(orig_sr, new_sr)] = resampler
+            while len(resamplers) > resampler_cache_size:
+                resamplers.popitem(last=False)
+        else:
+            resamplers.move_to_end((orig_sr, new_sr))
+        return resampler
+
+
+def resample(wave, orig_sr, new_sr):
+    resampler = get_resampler(orig_sr, new_sr)
+    if resampler is not None:
+        return resampler(wave)
+    resampled = librosa.resample(wave.cpu().numpy(), orig_sr=orig_sr, target_sr=new_sr)
+    return torch.from_numpy(resampled).to(wave.device)
+
+
+class AudioFrontend:
+    def __init__(self, wave, sr):
+        # wave 为 [1, T] 的 float32 张量
+        self.sr = sr
+        self.views = {sr: wave.float().to(device)}
+        self.view_locks = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def decode(cls, source, max_seconds=None):
+        # source 为文件路径或编码后的字节
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        with stage_timer("load"):
+            wave, sr = librosa.load(source, sr=None)
+        if max_seconds is not None:
+            wave = wave[:int(sr * max_seconds)]
+        return cls(torch.from_numpy(wave)[None], sr)
+
+    def view(self, sr):
+        # 不同采样率可以在不同线程中同时计算，同一采样率只计算一次
+        with self.lock:
+            view_lock = self.view_locks.setdefault(sr, threading.Lock())
+        with view_lock:
+            wave = self.views.get(sr)
+            if wave is None:
+                with stage_timer("resample"):
+                    wave = resample(self.views[self.sr], self.sr, sr)
+                self.views[sr] = wave
+            return wave
+
+
+# whisper 语义特征：超过 30 秒的音频按 30 秒窗口（重叠 5 秒）切分，所有窗口一次构建后按批送入编码器
+whisper_batch_size = 8  # 每次编码的窗口数量
+
+
+# 与 WhisperFeatureExtractor 相同的 log-mel（每个窗口补零到 30 秒），直接在张量所在设备上计算，不经过 numpy
+def whisper_log_mel(whisper_feature_extractor, windows):
+    fe = whisper_feature_extractor
+    waves = windows[0].new_zeros([len(windows), fe.n_samples])
+    for i, window in enumerate(windows):
+        waves[i, :window.size(0)] = window
+    stft = torch.stft(waves, fe.n_fft, fe.hop_length, window=torch.hann_window(fe.n_fft, device=waves.device),
+                      return_complex=True)
+    magnitudes = stft[..., :-1].abs() ** 2
+    mel_filters = torch.from_numpy(fe.mel_filters).to(waves.device, torch.float32)
+    log_spec = torch.clamp(mel_filters.T @ magnitudes, min=1e-10).log10()
+    log_spec = torch.maximum(log_spec, log_spec.amax(dim=(1, 2), keepdim=True) - 8.0)
+    attention_mask = (torch.arange(0, fe.n_samples, fe.hop_length)[None, :] <
+                      torch.LongTensor([window.size(0) for window in windows])[:, None]).long()
+    return (log_spec + 4.0) / 4.0, attention_mask
+
+
+def whisper_encode(whisper_model, whisper_feature_extractor, windows):
+    # windows 为 16k 的一维张量列表
+    input_features, attention_mask = whisper_log_mel(whisper_feature_extractor, windows)
+    input_features = whisper_model._mask_input_features(input_features, attention_mask=attention_mask).to(device)
+    outputs = whisper_model.encoder(
+        input_features.to(whisper_model.encoder.dtype),
+        head_mask=None,
+        output_attentions=False,
+        output_hidden_states=False,
+        return_dict=True,
+    )
+    return outputs.last_hidden_state.to(torch.float32)
+
+
+def whisper_windows(waves, overlapping_time=5):
+    # the first window covers 0~30s, every following window starts 25s later and
+    # repeats the last 5s of the previous one
+    windows = [waves[:16000 * 30]]
+    window_start = 16000 * (30 - overlapping_time)
+    while window_start + 16000 * overlapping_time < len(waves):
+        windows.append(waves[window_start:window_start + 16000 * 30])
+        window_start += 16000 * (30 - overlapping_time)
+    return windows
+
+
+def extract_semantic_features(whisper_model, whisper_feature_extractor, waves_16k):
+    overlapping_time = 5  # 5 seconds
+    windows = whisper_windows(waves_16k.squeeze(0), overlapping_time)
+    S_list = []
+    for i in range(0, len(windows), whisper_batch_size):
+        batch = windows[i:i + whisper_batch_size]
+        S_batch = whisper_encode(whisper_model, whisper_feature_extractor, batch)
+        for j, window in enumerate(batch):
+            S = S_batch[j:j + 1, :len(window) // 320 + 1]
+            S_list.append(S if i + j == 0 else S[:, 50 * overlapping_time:])
+    return torch.cat(S_list, dim=1)
+
+
+@torch.inference_mode()
+def extract_voice_features(target, f0_condition):
+    common_models = models.get("common")
+    vc_models = models.get(vc_model_name(f0_condition))
+    whisper_model = common_models["whisper_model"]
+    whisper_feature_extractor = common_models["whisper_feature_extractor"]
+    campplus_model = common_models["campplus_model"]
+    inference_module = vc_models["model"]
+    mel_fn = vc_models["to_mel"]
     sr = 22050 if not f0_condition else 44100
-    hop_length = 256 if not f0_condition else 512
-    max_context_window = sr // hop_length * 30
-    overlap_wave_len = overlap_frame_len * hop_length
-    # Load audio
-    source_audio = librosa.load(edge_output_filename, sr=sr)[0]
-    ref_audio = librosa.load(target, sr=sr)[0]
 
-    # Process audio
-    source_audio = torch.tensor(source_audio).unsqueeze(0).float().to(device)
-    ref_audio = torch.tensor(ref_audio[:sr * 25]).unsqueeze(0).float().to(device)
-
-    # Resample
-    ref_waves_16k = torchaudio.functional.resample(ref_audio, sr, 16000)
-    converted_waves_16k = torchaudio.functional.resample(source_audio, sr, 16000)
-    # if source audio less than 30 seconds, whisper can handle in one forward
-    if converted_waves_16k.size(-1) <= 16000 * 30:
-        alt_inputs = whisper_feature_extractor([converted_waves_16k.squeeze(0).cpu().numpy()],
-                                               return_tensors="pt",
-                                               return_attention_mask=True,
-                                               sampling_rate=16000)
-        alt_input_features = whisper_model._mask_input_features(
-            alt_inputs.input_features, attention_mask=alt_inputs.attention_mask).to(device)
-        alt_outputs = whisper_model.encoder(
-            alt_input_features.to(whisper_model.encoder.dtype),
-            head_mask=None,
-            output_attentions=False,
-            output_hidden_states=False,
-            return_dict=True,
-        )
-        S_alt = alt_outputs.last_hidden_state.to(torch.float32)
-        S_alt = S_alt[:, :converted_waves_16k.size(-1) // 320 + 1]
-    else:
-        overlapping_time = 5  # 5 seconds
-        S_alt_list = []
-        buffer = None
-        traversed_time = 0
-        while traversed_time < converted_waves_16k.size(-1):
-            if buffer is None:  # first chunk
-                chunk = converted_waves_16k[:, traversed_time:traversed_time + 16000 * 30]
-            else:
-                chunk = torch.cat(
-                    [buffer, converted_waves_16k[:, traversed_time:traversed_time + 16000 * (30 - overlapping_time)]],
-                    dim=-1)
-            alt_inputs = whisper_feature_extractor([chunk.squeeze(0).cpu().numpy()],
-                                                   return_tensors="pt",
-                                                   return_attention_mask=True,
-                                                   sampling_rate=16000)
-            alt_input_features = whisper_model._mask_input_features(
-                alt_inputs.input_features, attention_mask=alt_inputs.attention_mask).to(device)
-            alt_outputs = whisper_model.encoder(
-                alt_input_features.to(whisper_model.encoder.dtype),
-                head_mask=None,
-                output_attentions=False,
-                output_hidden_states=False,
-                return_dict=True,
-            )
-            S_alt = alt_outputs.last_hidden_state.to(torch.float32)
-            S_alt = S_alt[:, :chunk.size(-1) // 320 + 1]
-            if traversed_time == 0:
-                S_alt_list.append(S_alt)
-            else:
-                S_alt_list.append(S_alt[:, 50 * overlapping_time:])
-            buffer = chunk[:, -16000 * overlapping_time:]
-            traversed_time += 30 * 16000 if traversed_time == 0 else chunk.size(-1) - 16000 * overlapping_time
-        S_alt = torch.cat(S_alt_list, dim=1)
-
-    ori_waves_16k = torchaudio.functional.resample(ref_audio, sr, 16000)
-    ori_inputs = whisper_feature_extractor([ori_waves_16k.squeeze(0).cpu().numpy()],
-                                           return_tensors="pt",
-                                           return_attention_mask=True)
-    ori_input_features = whisper_model._mask_input_features(
-        ori_inputs.input_features, attention_mask=ori_inputs.attention_mask).to(device)
-    with torch.no_grad():
-        ori_outputs = whisper_model.encoder(
-            ori_input_features.to(whisper_model.encoder.dtype),
-            head_mask=None,
-            output_attentions=False,
-            output_hidden_states=False,
-            return_dict=True,
-        )
-    S_ori = ori_outputs.last_hidden_state.to(torch.float32)
-    S_ori = S_ori[:, :ori_waves_16k.size(-1) // 320 + 1]
-
-    mel = mel_fn(source_audio.to(device).float())
-    mel2 = mel_fn(ref_audio.to(device).float())
+    # 模型采样率和 16k 都由原始采样率的音频直接得到
+    reference = AudioFrontend.decode(target, max_seconds=25)
+    ref_audio = reference.view(sr)
+    ref_waves_16k = reference.view(16000)
 
-    target_lengths = torch.LongTensor([int(mel.size(2) * length_adjust)]).to(mel.device)
+    with stage_timer("whisper"):
+        S_ori = extract_semantic_features(whisper_model, whisper_feature_extractor, ref_waves_16k)
+
+    with stage_timer("mel"):
+        mel2 = mel_fn(ref_audio.to(device).float())
     target2_lengths = torch.LongTensor([mel2.size(2)]).to(mel2.device)
 
-    feat2 = torchaudio.compliance.kaldi.fbank(ref_waves_16k,
-                                              num_mel_bins=80,
-                                              dither=0,
-                                              sample_frequency=16000)
-    feat2 = feat2 - feat2.mean(dim=0, keepdim=True)
-    style2 = campplus_model(feat2.unsqueeze(0))
+    with stage_timer("campplus"):
+        feat2 = torchaudio.compliance.kaldi.fbank(ref_waves_16k,
+                                                  num_mel_bins=80,
+                                                  dither=0,
+                                                  sample_frequency=16000)
+        feat2 = feat2 - feat2.mean(dim=0, keepdim=True)
+        style2 = campplus_model(feat2.unsqueeze(0))
 
+    F0_ori = None
     if f0_condition:
-        F0_ori = rmvpe.infer_from_audio(ref_waves_16k[0], thred=0.03)
-        F0_alt = rmvpe.infer_from_audio(converted_waves_16k[0], thred=0.03)
-
+        with stage_timer("rmvpe"):
+            F0_ori = vc_models["rmvpe"].infer_from_audio(ref_waves_16k[0], thred=0.03)
         F0_ori = torch.from_numpy(F0_ori).to(device)[None]
+
+    # S_ori 只用于生成 prompt_condition，缓存 prompt_condition 即可
+    with stage_timer("length_regulator"):
+        prompt_condition, _, codes, commitment_loss, codebook_loss = inference_module.length_regulator(
+            S_ori, ylens=target2_lengths, n_quantizers=3, f0=F0_ori)
+    return {"mel2": mel2, "style2": style2, "prompt_condition": prompt_condition, "F0_ori": F0_ori}
+
+
+def voice_features_fingerprint(f0_condition):
+    # 与共享权重相同，按模型文件、上游版本和精度区分，另外计入 CPU 量化设置和特征格式版本
+    variant = vc_model_name(f0_condition)
+    # 模型加载时才会记录 model_sources，缓存命中时也需要先加载（随后的推理同样需要）
+    models.get("common")
+    models.get(variant)
+    source = ":".join([str(voice_features_version), model_sources.get("common", ""), model_sources.get(variant, ""),
+                       ",".join(sorted(cpu_quantize))])
+    return hashlib.md5(source.encode()).hexdigest()[:12]
+
+
+def get_voice_features(target, f0_condition):
+    key = f"{voice_cache_key(target, f0_condition)}_{voice_features_fingerprint(f0_condition)}"
+    features = voice_cache.get(key)
+    if features is None:
+        features = extract_voice_features(target, f0_condition)
+        voice_cache.put(key, features)
+    return features
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) > 0 else None
+
+
+# 与 cfm.inference 相同的 Euler 求解，每行的提示长度和序列长度可以不同，补零部分通过 x_lens 屏蔽
+def batched_cfm_inference(cfm, mus, prompts, styles, n_timesteps, inference_cfg_rate, temperature=1.0):
+    B = len(mus)
+    lengths = [mu.size(1) for mu in mus]
+    prompt_lens = [prompt.size(-1) for prompt in prompts]
+    T = max(lengths)
+    mu = torch.zeros([B, T, mus[0].size(2)], device=mus[0].device, dtype=mus[0].dtype)
+    prompt_x = torch.zeros([B, cfm.in_channels, T], device=mus[0].device, dtype=prompts[0].dtype)
+    for b in range(B):
+        mu[b, :lengths[b]] = mus[b][0]
+        prompt_x[b, :, :prompt_lens[b]] = prompts[b][0]
+        if cfm.zero_prompt_speech_token:
+            mu[b, :prompt_lens[b]] = 0
+    style = torch.cat(styles, dim=0)
+    x_lens = torch.LongTensor(lengths).to(mu.device)
+    prompt_mask = (torch.arange(T, device=mu.device)[None, :] <
+                   torch.LongTensor(prompt_lens).to(mu.device)[:, None])[:, None, :]
+
+    x = torch.randn([B, cfm.in_channels, T], device=mu.device) * temperature
+    x = x.masked_fill(prompt_mask, 0)
+    t_span = torch.linspace(0, 1, n_timesteps + 1, device=mu.device)
+    t = t_span[0]
+    if inference_cfg_rate > 0:
+        stacked_prompt_x = torch.cat([prompt_x, torch.zeros_like(prompt_x)], dim=0)
+        stacked_style = torch.cat([style, torch.zeros_like(style)], dim=0)
+        stacked_mu = torch.cat([mu, torch.zeros_like(mu)], dim=0)
+        stacked_x_lens = torch.cat([x_lens, x_lens], dim=0)
+    for step in range(1, len(t_span)):
+        dt = t_span[step] - t_span[step - 1]
+        if inference_cfg_rate > 0:
+            stacked_dphi_dt = cfm.estimator(torch.cat([x, x], dim=0), stacked_prompt_x, stacked_x_lens,
+                                            t.expand(2 * B), stacked_style, stacked_mu)
+            dphi_dt, cfg_dphi_dt = stacked_dphi_dt.chunk(2, dim=0)
+            dphi_dt = (1.0 + inference_cfg_rate) * dphi_dt - inference_cfg_rate * cfg_dphi_dt
+        else:
+            dphi_dt = cfm.estimator(x, prompt_x, x_lens, t.expand(B), style, mu)
+        x = x + dt * dphi_dt
+        t = t + dt
+        x = x.masked_fill(prompt_mask, 0)
+    return [x[b:b + 1, :, :lengths[b]] for b in range(B)]
+
+
+class CFMBatchScheduler:
+    def __init__(self, max_batch_size, max_wait):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = []
+        # 正在逐块转换的请求数，所有请求都已提交当前块时不再等待
+        self.active_requests = 0
+        self.cond = threading.Condition()
+        self.latencies = deque(maxlen=1000)
+        self.batch_sizes = deque(maxlen=1000)
+        self.finish_times = deque(maxlen=1000)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @contextlib.contextmanager
+    def request(self):
+        with self.cond:
+            self.active_requests += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active_requests -= 1
+                self.cond.notify()
+
+    def inference(self, model_name, inference_module, cat_condition, mel2, style2, diffusion_steps,
+                  inference_cfg_rate):
+        item = {
+            "key": (model_name, diffusion_steps, inference_cfg_rate),
+            "cfm": inference_module.cfm,
+            "cat_condition": cat_condition,
+            "mel2": mel2,
+            "style2": style2,
+            "future": Future(),
+            "submit_time": time.time(),
+        }
+        with self.cond:
+            self.pending.append(item)
+            self.cond.notify()
+        output = item["future"].result()
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.add("cfm_queue_wait", item["start_time"] - item["submit_time"])
+            metrics.add("cfm", item["finish_time"] - item["start_time"])
+        return output
+
+    def _next_batch(self):
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+            first = self.pending[0]
+            deadline = first["submit_time"] + self.max_wait
+            while True:
+                batch = [item for item in self.pending if item["key"] == first["key"]][:self.max_batch_size]
+                remaining = deadline - time.time()
+                if len(batch) >= self.max_batch_size or len(self.pending) >= self.active_requests or remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            for item in batch:
+                self.pending.remove(item)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            _, diffusion_steps, inference_cfg_rate = batch[0]["key"]
+            start_time = time.time()
+            for item in batch:
+                item["start_time"] = start_time
+            try:
+                with torch.inference_mode(), autocast_context():
+                    if len(batch) == 1:
+                        item = batch[0]
+                        outputs = [item["cfm"].inference(item["cat_condition"],
+                                                         torch.LongTensor([item["cat_condition"].size(1)]).to(
+                                                             item["mel2"].device),
+                                                         item["mel2"], item["style2"], None, diffusion_steps,
+                                                         inference_cfg_rate=inference_cfg_rate)]
+                    else:
+                        outputs = batched_cfm_inference(batch[0]["cfm"],
+                                                        [item["cat_condition"] for item in batch],
+                                                        [item["mel2"] for item in batch],
+                                                        [item["style2"] for item in batch],
+                                                        diffusion_steps, inference_cfg_rate)
+                if metrics_cuda_sync and torch.cuda.is_available():
+                    torch.cuda.synchronize()
+            except Exception as e:
+                for item in batch:
+                    item["future"].set_exception(e)
+                continue
+            finish_time = time.time()
+            self.batch_sizes.append(len(batch))
+            for item, output in zip(batch, outputs):
+                item["finish_time"] = finish_time
+                self.latencies.append(finish_time - item["submit_time"])
+                self.finish_times.append(finish_time)
+                item["future"].set_result(output)
+
+    def stats(self):
+        latencies = list(self.latencies)
+        finish_times = list(self.finish_times)
+        elapsed = finish_times[-1] - finish_times[0] if len(finish_times) > 1 else 0
+        return {
+            "chunk_latency_p50": percentile(latencies, 50),
+            "chunk_latency_p99": percentile(latencies, 99),
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+            "chunks_per_second": (len(finish_times) - 1) / elapsed if elapsed > 0 else None,
+        }
+
+
+cfm_scheduler = CFMBatchScheduler(cfm_max_batch_size, cfm_max_wait)
+
+
+# 流式输出编码：每个请求使用一个持续运行的 ffmpeg 编码进程，在后台线程中编码，与下一块的推理并行，输出无缝衔接
+# 支持 mp3、opus（ogg 封装）和 pcm（16 位单声道原始数据）
+class StreamEncoder:
+    def __init__(self, sr, fmt="mp3"):
+        self.buffer = bytearray()
+        self.cond = threading.Condition()
+        self.finished = False
+        self.fed = 0
+        self.written = 0
+        self.last_output_time = 0
+        self.queue = queue.Queue()
+        if fmt == "pcm":
+            self.process = None
+        else:
+            codec_args = {
+                "mp3": ["-b:a", bitrate, "-f", "mp3"],
+                "opus": ["-c:a", "libopus", "-b:a", opus_bitrate, "-page_duration", "20000", "-f", "ogg"],
+            }[fmt]
+            # 输入是裸 PCM，关闭探测，否则 ffmpeg 会攒够数据才开始输出
+            try:
+                self.process = subprocess.Popen([AudioSegment.converter, "-loglevel", "error",
+                                                 "-probesize", "32", "-analyzeduration", "0",
+                                                 "-f", "s16le", "-ar", str(sr), "-ac", "1", "-i", "pipe:0",
+                                                 *codec_args, "-flush_packets", "1", "pipe:1"],
+                                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            except OSError as e:
+                raise RuntimeError(f"cannot start ffmpeg ({AudioSegment.converter}) for {fmt} encoding: {e}; "
+                                   f"install ffmpeg or use the pcm format") from e
+            threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def _append(self, data):
+        with self.cond:
+            self.buffer.extend(data)
+            self.last_output_time = time.time()
+            self.cond.notify_all()
+
+    def _finish(self):
+        with self.cond:
+            self.finished = True
+            self.cond.notify_all()
+
+    def _write(self):
+        while True:
+            output_wave = self.queue.get()
+            if output_wave is None:
+                break
+            data = np.clip(output_wave * 32768.0, -32768, 32767).astype(np.int16).tobytes()
+            if self.process is None:
+                self._append(data)
+            else:
+                try:
+                    self.process.stdin.write(data)
+                    self.process.stdin.flush()
+                except (BrokenPipeError, ValueError):
+                    break
+            with self.cond:
+                self.written += 1
+                self.cond.notify_all()
+        if self.process is None:
+            self._finish()
+        else:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(65536)
+            if not data:
+                break
+            self._append(data)
+        self.process.wait()
+        self._finish()
+
+    def feed(self, output_wave):
+        with self.cond:
+            self.fed += 1
+        self.queue.put(output_wave)
+
+    def read(self):
+        # 等送入的音频全部写入编码器，并且编码器在 stream_drain_time 内没有新输出，即认为当前块已编码完
+        # （mp3 编码器会保留最后一帧，随下一块一起输出）；pcm 没有编码延迟，写入后即可返回
+        with self.cond:
+            while not self.finished:
+                if self.process is None and self.written >= self.fed:
+                    break
+                if self.written >= self.fed and self.buffer:
+                    idle = time.time() - self.last_output_time
+                    if idle >= stream_drain_time:
+                        break
+                    self.cond.wait(stream_drain_time - idle)
+                else:
+                    self.cond.wait()
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        return data
+
+    def close(self):
+        # 结束编码并返回剩余的全部数据
+        self.queue.put(None)
+        with self.cond:
+            while not self.finished:
+                self.cond.wait()
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        return data
+
+    def abort(self):
+        self.queue.put(None)
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+
+# 完整输出：每块转换完成后追加写入文件，返回文件路径，内存占用与输出长度无关
+output_dir = "./checkpoints/outputs"
+output_format = "wav"  # "wav"、"flac" 或 "mp3"
+output_keep_files = 200  # 保留最近的输出文件数量，更早的文件会被删除
+
+
+def new_output_path(fmt):
+    os.makedirs(output_dir, exist_ok=True)
+    files = [os.path.join(output_dir, name) for name in os.listdir(output_dir) if not name.endswith(".tmp")]
+    if len(files) >= output_keep_files:
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - output_keep_files + 1]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return os.path.join(output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{fmt}")
+
+
+class OutputSink:
+    def __init__(self, sr, fmt=None, path=None):
+        self.format = fmt or output_format
+        self.path = path or new_output_path(self.format)
+        self.tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        if self.format == "mp3":
+            # mp3 通过 ffmpeg 边编码边写入
+            self.encoder = StreamEncoder(sr, "mp3")
+            self.file = open(self.tmp_path, "wb")
+        else:
+            self.encoder = None
+            self.file = sf.SoundFile(self.tmp_path, "w", samplerate=sr, channels=1, format=self.format.upper(),
+                                     subtype="PCM_16")
+
+    def write(self, output_wave):
+        if self.encoder is None:
+            self.file.write(np.clip(output_wave, -1.0, 1.0))
+        else:
+            self.encoder.feed(output_wave)
+            self.file.write(self.encoder.read())
+
+    def close(self):
+        if self.encoder is not None:
+            self.file.write(self.encoder.close())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        if self.encoder is not None:
+            self.encoder.abort()
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# 在后台线程中迭代生成器，最多提前生成 max_prefetch 项；调用方停止迭代时后台线程随之结束
+def background_iter(iterable, max_prefetch=1):
+    items = queue.Queue(max_prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+
+# 依次返回每个分块的帧数，每块至少比交叉淡化的重叠部分多一倍
+def chunk_windows(first_seconds, growth, frame_rate, max_window):
+    first_seconds = first_chunk_seconds if first_seconds is None else first_seconds
+    growth = chunk_growth if growth is None else growth
+    min_window = 2 * overlap_frame_len
+    window = max_window if not first_seconds else int(first_seconds * frame_rate)
+    window = min(max(window, min_window), max_window)
+    while True:
+        yield window
+        window = min(max(int(window * growth), window + 1), max_window)
+
+
+# 源音频（AudioFrontend）的语义特征、mel 和 F0
+def extract_source_features(source_audio, f0_condition):
+    common_models = models.get("common")
+    vc_models = models.get(vc_model_name(f0_condition))
+    whisper_model = common_models["whisper_model"]
+    whisper_feature_extractor = common_models["whisper_feature_extractor"]
+    mel_fn = vc_models["to_mel"]
+    sr = 22050 if not f0_condition else 44100
+    source_wave = source_audio.view(sr)
+    converted_waves_16k = source_audio.view(16000)
+
+    with stage_timer("whisper"):
+        S_alt = extract_semantic_features(whisper_model, whisper_feature_extractor, converted_waves_16k)
+
+    with stage_timer("mel"):
+        mel = mel_fn(source_wave)
+
+    F0_alt = None
+    if f0_condition:
+        with stage_timer("rmvpe"):
+            F0_alt = vc_models["rmvpe"].infer_from_audio(converted_waves_16k[0], thred=0.03)
         F0_alt = torch.from_numpy(F0_alt).to(device)[None]
+    return {"S_alt": S_alt, "mel": mel, "F0_alt": F0_alt}
+
 
+# 转换一段音频（AudioFrontend），逐块返回 (output_wave, is_last_chunk)
+# voice_features 也可以是 Future，源音频特征提取的同时等待参考音色特征
+@torch.no_grad()
+@torch.inference_mode()
+def convert_audio(source_audio, voice_features, diffusion_steps, length_adjust, inference_cfg_rate, f0_condition,
+                  auto_f0_adjust, pitch_shift, first_chunk_seconds=None, chunk_growth=None):
+    vc_models = models.get(vc_model_name(f0_condition))
+    inference_module = vc_models["model"]
+    bigvgan_fn = vc_models["bigvgan_model"]
+    sr = 22050 if not f0_condition else 44100
+    hop_length = 256 if not f0_condition else 512
+    max_context_window = sr // hop_length * 30
+    overlap_wave_len = overlap_frame_len * hop_length
+    # Process audio
+    source_features = extract_source_features(source_audio, f0_condition)
+    if isinstance(voice_features, Future):
+        voice_features = voice_features.result()
+    mel2 = voice_features["mel2"]
+    style2 = voice_features["style2"]
+    prompt_condition = voice_features["prompt_condition"]
+    F0_ori = voice_features.get("F0_ori")
+    S_alt = source_features["S_alt"]
+    mel = source_features["mel"]
+    F0_alt = source_features["F0_alt"]
+
+    target_lengths = torch.LongTensor([int(mel.size(2) * length_adjust)]).to(mel.device)
+
+    if f0_condition:
         voiced_F0_ori = F0_ori[F0_ori > 1]
         voiced_F0_alt = F0_alt[F0_alt > 1]
 
@@ -289,90 +1567,439 @@ def voice_conversion(tts_text, tts_choice, speed, pitch, target, diffusion_steps
         if pitch_shift != 0:
             shifted_f0_alt[F0_alt > 1] = adjust_f0_semitones(shifted_f0_alt[F0_alt > 1], pitch_shift)
     else:
-        F0_ori = None
         F0_alt = None
         shifted_f0_alt = None
 
     # Length regulation
-    cond, _, codes, commitment_loss, codebook_loss = inference_module.length_regulator(S_alt, ylens=target_lengths,
-                                                                                       n_quantizers=3,
-                                                                                       f0=shifted_f0_alt)
-    prompt_condition, _, codes, commitment_loss, codebook_loss = inference_module.length_regulator(S_ori,
-                                                                                                   ylens=target2_lengths,
-                                                                                                   n_quantizers=3,
-                                                                                                   f0=F0_ori)
+    with stage_timer("length_regulator"):
+        cond, _, codes, commitment_loss, codebook_loss = inference_module.length_regulator(S_alt,
+                                                                                           ylens=target_lengths,
+                                                                                           n_quantizers=3,
+                                                                                           f0=shifted_f0_alt)
 
+    if max_prompt_seconds is not None:
+        prompt_frames = int(max_prompt_seconds * sr / hop_length)
+        mel2 = mel2[:, :, :prompt_frames]
+        prompt_condition = prompt_condition[:, :prompt_frames]
     max_source_window = max_context_window - mel2.size(2)
+    source_windows = chunk_windows(first_chunk_seconds, chunk_growth, sr // hop_length, max_source_window)
     # split source condition (cond) into chunks
     processed_frames = 0
-    generated_wave_chunks = []
     # generate chunk by chunk and stream the output
-    while processed_frames < cond.size(1):
-        chunk_cond = cond[:, processed_frames:processed_frames + max_source_window]
-        is_last_chunk = processed_frames + max_source_window >= cond.size(1)
-        cat_condition = torch.cat([prompt_condition, chunk_cond], dim=1)
-        with torch.autocast(device_type=device.type, dtype=torch.float16):
-            # Voice Conversion
-            vc_target = inference_module.cfm.inference(cat_condition,
-                                                       torch.LongTensor([cat_condition.size(1)]).to(mel2.device),
-                                                       mel2, style2, None, diffusion_steps,
-                                                       inference_cfg_rate=inference_cfg_rate)
+    with cfm_scheduler.request():
+        while processed_frames < cond.size(1):
+            source_window = next(source_windows)
+            chunk_cond = cond[:, processed_frames:processed_frames + source_window]
+            is_last_chunk = processed_frames + source_window >= cond.size(1)
+            cat_condition = torch.cat([prompt_condition, chunk_cond], dim=1)
+            # Voice Conversion, batched with concurrent requests by cfm_scheduler
+            vc_target = cfm_scheduler.inference(vc_model_name(f0_condition), inference_module, cat_condition, mel2,
+                                                style2, diffusion_steps, inference_cfg_rate)
             vc_target = vc_target[:, :, mel2.size(-1):]
-        vc_wave = bigvgan_fn(vc_target.float())[0]
-        if processed_frames == 0:
-            if is_last_chunk:
-                output_wave = vc_wave[0].cpu().numpy()
-                generated_wave_chunks.append(output_wave)
-                output_wave = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave.tobytes(), frame_rate=sr,
-                    sample_width=output_wave.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=bitrate).read()
-                yield edge_audio, mp3_bytes, (sr, np.concatenate(generated_wave_chunks))
+            with stage_timer("vocoder"), autocast_context(vocoder=True):
+                vc_wave = bigvgan_fn(vc_target.float())[0].float()
+            if processed_frames == 0:
+                if is_last_chunk:
+                    output_wave = vc_wave[0].cpu().numpy()
+                    yield output_wave, True
+                    break
+                output_wave = vc_wave[0, :-overlap_wave_len].cpu().numpy()
+                previous_chunk = vc_wave[0, -overlap_wave_len:]
+                processed_frames += vc_target.size(2) - overlap_frame_len
+                yield output_wave, False
+            elif is_last_chunk:
+                output_wave = crossfade(previous_chunk.cpu().numpy(), vc_wave[0].cpu().numpy(), overlap_wave_len)
+                processed_frames += vc_target.size(2) - overlap_frame_len
+                yield output_wave, True
                 break
-            output_wave = vc_wave[0, :-overlap_wave_len].cpu().numpy()
-            generated_wave_chunks.append(output_wave)
-            previous_chunk = vc_wave[0, -overlap_wave_len:]
-            processed_frames += vc_target.size(2) - overlap_frame_len
-            output_wave = (output_wave * 32768.0).astype(np.int16)
-            mp3_bytes = AudioSegment(
-                output_wave.tobytes(), frame_rate=sr,
-                sample_width=output_wave.dtype.itemsize, channels=1
-            ).export(format="mp3", bitrate=bitrate).read()
-            yield edge_audio, mp3_bytes, None
-        elif is_last_chunk:
-            output_wave = crossfade(previous_chunk.cpu().numpy(), vc_wave[0].cpu().numpy(), overlap_wave_len)
-            generated_wave_chunks.append(output_wave)
-            processed_frames += vc_target.size(2) - overlap_frame_len
-            output_wave = (output_wave * 32768.0).astype(np.int16)
-            mp3_bytes = AudioSegment(
-                output_wave.tobytes(), frame_rate=sr,
-                sample_width=output_wave.dtype.itemsize, channels=1
-            ).export(format="mp3", bitrate=bitrate).read()
-            yield edge_audio, mp3_bytes, (sr, np.concatenate(generated_wave_chunks))
+            else:
+                output_wave = crossfade(previous_chunk.cpu().numpy(), vc_wave[0, :-overlap_wave_len].cpu().numpy(),
+                                        overlap_wave_len)
+                previous_chunk = vc_wave[0, -overlap_wave_len:]
+                processed_frames += vc_target.size(2) - overlap_frame_len
+                yield output_wave, False
+
+
+# 分句流水线：按句切分文本，转换当前句时预取下一句的 edge tts，首段音频只取决于第一句的合成和转换
+tts_segment_max_chars = 100  # 超过该长度的句子再按逗号等分句切分
+
+
+def split_tts_text(text, max_chars=None):
+    max_chars = max_chars or tts_segment_max_chars
+    segments = []
+    for sentence in re.split(r"(?<=[。！？!?；;…\n])|(?<=[.])\s+", text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        # 只有标点的片段（如 "……" 被切开）并入上一句，edge tts 无法合成纯标点
+        if not re.search(r"\w", sentence):
+            if segments:
+                segments[-1] += sentence
+            continue
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+            continue
+        current = ""
+        for clause in re.split(r"(?<=[，,、：:])", sentence):
+            if current.strip() and len(current) + len(clause) > max_chars:
+                segments.append(current.strip())
+                current = ""
+            current += clause
+        if current.strip():
+            segments.append(current.strip())
+    return segments or [text]
+
+
+# 合成并转换整段文本，逐块返回 (edge_audio_path, output_wave, is_last_chunk)
+# edge_audio_path 为 Edge TTS 原始音频，分句时在最后一句才拼接出完整文件，之前为 None
+@torch.no_grad()
+@torch.inference_mode()
+def synthesize_and_convert(tts_text, voice, speed_str, pitch_str, target, diffusion_steps, length_adjust,
+                           inference_cfg_rate, f0_condition, auto_f0_adjust, pitch_shift, pipelined=False,
+                           first_chunk_seconds=None, chunk_growth=None, metrics=None):
+    current_metrics.set(metrics)
+    sr = 22050 if not f0_condition else 44100
+    segments = split_tts_text(tts_text) if pipelined else [tts_text]
+    voice_executor = ThreadPoolExecutor(max_workers=1)
+    tts_jobs = []
+    edge_preview = None
+    try:
+        # 转换当前句的同时请求后面的句子，最多提前 edge_tts_prefetch 句
+        def prefetch(i):
+            while len(tts_jobs) < min(i + 1 + edge_tts_prefetch, len(segments)):
+                tts_jobs.append(edge_tts_submit(segments[len(tts_jobs)], voice, speed_str, pitch_str))
+
+        prefetch(0)
+
+        # Reference voice features, cached by reference audio content
+        # 与 Edge TTS 和源音频的特征提取同时进行
+        def voice_features_job():
+            with stage_timer("voice_features"):
+                return get_voice_features(target, f0_condition)
+
+        voice_features = voice_executor.submit(contextvars.copy_context().run, voice_features_job)
+        edge_audio = None
+        for i in range(len(segments)):
+            prefetch(i)
+            edge_key, tts_future = tts_jobs[i]
+            with stage_timer("edge_tts_wait"):
+                edge_bytes = tts_future.result()
+            edge_tts_cache.put(edge_key, edge_bytes)
+            is_last_segment = i + 1 == len(segments)
+            if len(segments) == 1:
+                edge_audio = edge_tts_cache.path(edge_key)
+            else:
+                # 分句合成的结果逐句追加到一个 mp3 文件用于预览，最后一句时才返回
+                if edge_preview is None:
+                    edge_preview_path = new_output_path("mp3")
+                    edge_preview = open(f"{edge_preview_path}.tmp", "wb")
+                edge_preview.write(edge_bytes)
+                if is_last_segment:
+                    edge_preview.close()
+                    os.replace(f"{edge_preview_path}.tmp", edge_preview_path)
+                    edge_audio = edge_preview_path
+
+            # Load audio
+            source_audio = AudioFrontend.decode(edge_bytes)
+            # 只有第一句需要小分块尽快输出，之后的句子在前面的音频播放时转换，使用最大窗口
+            for output_wave, is_last_chunk in convert_audio(source_audio, voice_features, diffusion_steps,
+                                                            length_adjust, inference_cfg_rate, f0_condition,
+                                                            auto_f0_adjust, pitch_shift,
+                                                            first_chunk_seconds if i == 0 else 0, chunk_growth):
+                yield edge_audio, output_wave, is_last_chunk and is_last_segment
+    finally:
+        for _, tts_future in tts_jobs:
+            tts_future.cancel()
+        voice_executor.shutdown(wait=False)
+        if edge_preview is not None and not edge_preview.closed:
+            edge_preview.close()
+            os.remove(edge_preview.name)
+
+
+def voice_conversion(*args, **kwargs):
+    # 多进程服务时由推理进程完成推理，界面进程只负责转发
+    conversion = worker_pool.conversion_stream if worker_pool is not None else conversion_stream
+    for edge_audio, stream_bytes, full_output in conversion(*args, **kwargs):
+        yield gr.Audio(value=edge_audio) if edge_audio is not None else None, stream_bytes, full_output
+
+
+def conversion_stream(tts_text, tts_choice, speed, pitch, target, diffusion_steps, length_adjust, inference_cfg_rate,
+                      f0_condition,
+                      auto_f0_adjust,
+                      pitch_shift,
+                      pipelined=False,
+                      first_chunk_seconds=None,
+                      chunk_growth=None,
+                      stream_format="mp3",
+                      full_output=True,
+                      submit_time=None):
+    speed_str = f"{speed:+d}%"
+    pitch_str = f"{pitch:+d}Hz"
+    # 界面中的音色带有性别后缀，例如 "zh-CN-YunjianNeural-Male"
+    voice = "-".join(tts_choice.split("-")[:-1]) if tts_choice.endswith(("-Male", "-Female")) else tts_choice
+    sr = 22050 if not f0_condition else 44100
+    metrics = RequestMetrics(voice=tts_choice, text_chars=len(tts_text), diffusion_steps=diffusion_steps,
+                             length_adjust=length_adjust, f0_condition=f0_condition, pipelined=pipelined,
+                             first_chunk_seconds=first_chunk_seconds, chunk_growth=chunk_growth,
+                             stream_format=stream_format) if metrics_enabled else None
+    # submit_time 为接口收到请求的时间，之后到开始推理之间为接口并发上限和推理进程的排队时间
+    if metrics is not None and submit_time is not None:
+        metrics.add("request_queue_wait", max(0.0, metrics.start_time - submit_time))
+    status = "cancelled"
+    chunks = stream_encoder = output_sink = None
+    try:
+        # 编码器先于推理启动，ffmpeg 无法启动时不会开始推理，错误与推理失败一样记录
+        stream_encoder = StreamEncoder(sr, stream_format)
+        # 完整输出边转换边写入文件，不在内存中保留全部分块
+        output_sink = OutputSink(sr) if full_output else None
+        # 推理在后台线程中进行，当前块编码和发送时下一块已经开始推理
+        chunks = background_iter(synthesize_and_convert(tts_text, voice, speed_str, pitch_str, target,
+                                                        diffusion_steps, length_adjust, inference_cfg_rate,
+                                                        f0_condition, auto_f0_adjust, pitch_shift, pipelined,
+                                                        first_chunk_seconds, chunk_growth, metrics))
+        for edge_audio, output_wave, is_last_chunk in chunks:
+            if output_sink is not None:
+                output_sink.write(output_wave)
+            stream_encoder.feed(output_wave)
+            encode_start_time = time.time()
+            stream_bytes = stream_encoder.close() if is_last_chunk else stream_encoder.read()
+            if metrics is not None:
+                metrics.add("encode_wait", time.time() - encode_start_time)
+                metrics.chunk(output_wave, sr)
+            if is_last_chunk:
+                output_path = output_sink.close() if output_sink is not None else None
+                status = "ok"
+                if metrics is not None:
+                    log_request_metrics(metrics, status)
+                yield edge_audio, stream_bytes, output_path
+            else:
+                yield edge_audio, stream_bytes, None
+    except EOFError:
+        status = "error"
+        yield None, None, None
+    except Exception:
+        status = "error"
+        info = traceback.format_exc()
+        print(info)
+        yield None, None, None
+    finally:
+        if chunks is not None:
+            chunks.close()
+        if stream_encoder is not None:
+            stream_encoder.abort()
+        if output_sink is not None and status != "ok":
+            output_sink.abort()
+        if metrics is not None and status != "ok":
+            log_request_metrics(metrics, status)
+
+
+def serve_worker(worker_id, jobs, results):
+    global metrics_sink, worker_process
+    worker_process = True
+    metrics_sink = lambda summary: results.put((None, ("metrics", worker_id, summary)))
+    models.preload(preload_models)
+    results.put((None, ("ready", worker_id, os.getpid())))
+    print(f"[workers] worker {worker_id} (pid {os.getpid()}) ready")
+
+    running = set()
+    cancelled = set()
+    lock = threading.Lock()
+
+    def run(job_id, args, kwargs):
+        stream = conversion_stream(*args, **kwargs)
+        try:
+            for item in stream:
+                if job_id in cancelled:
+                    break
+                results.put((job_id, item))
+        except Exception as e:
+            traceback.print_exc()
+            # 异常对象不一定能序列化，转为 RuntimeError 交给界面进程抛出
+            results.put((job_id, RuntimeError(f"{type(e).__name__}: {e}")))
+        finally:
+            stream.close()
+            with lock:
+                running.discard(job_id)
+                cancelled.discard(job_id)
+            results.put((job_id, None))
+
+    # 每个推理进程内同时处理多个请求，扩散推理仍可在进程内合批
+    executor = ThreadPoolExecutor(max_workers=request_concurrency)
+    while True:
+        job = jobs.get()
+        if job is None:
             break
-        else:
-            output_wave = crossfade(previous_chunk.cpu().numpy(), vc_wave[0, :-overlap_wave_len].cpu().numpy(),
-                                    overlap_wave_len)
-            generated_wave_chunks.append(output_wave)
-            previous_chunk = vc_wave[0, -overlap_wave_len:]
-            processed_frames += vc_target.size(2) - overlap_frame_len
-            output_wave = (output_wave * 32768.0).astype(np.int16)
-            mp3_bytes = AudioSegment(
-                output_wave.tobytes(), frame_rate=sr,
-                sample_width=output_wave.dtype.itemsize, channels=1
-            ).export(format="mp3", bitrate=bitrate).read()
-            yield edge_audio, mp3_bytes, None
+        if job[0] == "cancel":
+            with lock:
+                if job[1] in running:
+                    cancelled.add(job[1])
+            continue
+        _, job_id, args, kwargs = job
+        with lock:
+            running.add(job_id)
+        executor.submit(run, job_id, args, kwargs)
+    executor.shutdown(wait=False, cancel_futures=True)
 
 
-# edge tts
-edge_output_filename = "edge_output.mp3"
+class WorkerPool:
+    def __init__(self, num_workers):
+        # spawn 方式启动，推理进程中可以正常使用 cuda
+        self.ctx = torch.multiprocessing.get_context("spawn")
+        self.results = self.ctx.Queue()
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.next_job_id = 0
+        self.workers = []
+        # 第一个进程就绪后共享权重已写入，之后才启动或重启其余进程
+        self.weights_ready = threading.Event()
+        for worker_id in range(num_workers):
+            self.workers.append({
+                "id": worker_id, "jobs": self.ctx.Queue(), "ready": threading.Event(), "pid": None, "depth": 0,
+                "served": 0, "process": None, "start_failures": 0, "failed": False,
+                # 按分配过的请求推测进程中已加载的模型和已缓存的音色
+                "models": OrderedDict(), "voices": OrderedDict(),
+            })
+        threading.Thread(target=self._dispatch_results, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
 
-# 如果不使用下面的默认音色，可以通过以下代码获取全部edge tts音色，需要外网访问
-# tts_voices_list = asyncio.get_event_loop().run_until_complete(edge_tts.list_voices(proxy=edge_proxy))
-# tts_speakers = [f"{v['ShortName']}-{v['Gender']}" for v in tts_voices_list]
+    def _spawn(self, worker):
+        worker["process"] = self.ctx.Process(target=serve_worker, args=(worker["id"], worker["jobs"], self.results),
+                                             daemon=True)
+        worker["process"].start()
 
-# 默认的edge tts音色
+    def _monitor(self):
+        # 第一个进程加载模型并写入共享权重后再启动其余进程，其余进程直接以 mmap 方式加载
+        # 之后每秒检查一次，退出的进程释放其请求并重新启动
+        self._spawn(self.workers[0])
+        while True:
+            for worker in self.workers:
+                if worker["process"] is not None and not worker["process"].is_alive():
+                    self._worker_exited(worker)
+                elif (worker["process"] is None and not worker["failed"]
+                      and (worker["id"] == 0 or self.weights_ready.is_set())):
+                    self._spawn(worker)
+            if self.workers[0]["failed"] and not self.weights_ready.is_set():
+                # 第一个进程始终无法就绪（通常是模型加载失败），其余进程同样无法启动
+                with self.lock:
+                    for worker in self.workers:
+                        worker["failed"] = True
+            if all(worker["failed"] for worker in self.workers):
+                print("[workers] no inference worker available")
+                return
+            time.sleep(1.0)
+
+    def _worker_exited(self, worker):
+        with self.lock:
+            if not worker["ready"].is_set():
+                worker["start_failures"] += 1
+            worker["failed"] = worker["start_failures"] >= worker_max_start_failures
+            worker["ready"].clear()
+            worker["process"] = None
+            worker["pid"] = None
+            worker["depth"] = 0
+            worker["models"].clear()
+            worker["voices"].clear()
+            # 旧队列中未处理的请求随进程一起丢弃，新进程使用新的队列
+            worker["jobs"] = self.ctx.Queue()
+            released = [job_id for job_id, job in self.jobs.items() if job["worker"] is worker]
+            released = [self.jobs.pop(job_id) for job_id in released]
+        print(f"[workers] worker {worker['id']} exited, {len(released)} requests failed"
+              + (", giving up after repeated start failures" if worker["failed"] else ", restarting"))
+        for job in released:
+            job["results"].put(RuntimeError(f"worker {worker['id']} exited"))
+
+    def _dispatch_results(self):
+        while True:
+            job_id, item = self.results.get()
+            if job_id is None:
+                if item[0] == "ready":
+                    worker = self.workers[item[1]]
+                    with self.lock:
+                        worker["pid"] = item[2]
+                        worker["start_failures"] = 0
+                        worker["models"].update((name, True) for name in preload_models if name != "common")
+                    worker["ready"].set()
+                    self.weights_ready.set()
+                elif item[0] == "metrics":
+                    recent_metrics.append({**item[2], "worker": item[1]})
+                continue
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is not None and item is None:
+                    del self.jobs[job_id]
+                    job["worker"]["depth"] -= 1
+                    job["worker"]["served"] += 1
+            if job is not None:
+                job["results"].put(item)
+
+    def _submit(self, model_name, voice_key, args, kwargs, results):
+        # 选择进程和登记请求在同一把锁内完成，进程退出时登记过的请求都会被释放
+        with self.lock:
+            # 优先已就绪的进程，都未就绪时交给正在启动的进程排队，都已放弃时直接失败
+            candidates = ([w for w in self.workers if w["ready"].is_set()]
+                          or [w for w in self.workers if not w["failed"] and (w["process"] is not None or w["id"] == 0)])
+            if not candidates:
+                raise RuntimeError("no inference worker available")
+            min_depth = min(w["depth"] for w in candidates)
+
+            def rank(w):
+                affinity = 2 * (voice_key in w["voices"]) + (model_name in w["models"])
+                if w["depth"] > min_depth + worker_affinity_slack:
+                    affinity = 0
+                return -affinity, w["depth"], w["served"]
+
+            worker = min(candidates, key=rank)
+            worker["depth"] += 1
+            for cache, key, max_size in ((worker["models"], model_name, max_loaded_models),
+                                         (worker["voices"], voice_key, voice_cache_size)):
+                if key is None:
+                    continue
+                cache[key] = True
+                cache.move_to_end(key)
+                while max_size is not None and len(cache) > max_size:
+                    cache.popitem(last=False)
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            self.jobs[job_id] = {"worker": worker, "results": results}
+            worker["jobs"].put(("run", job_id, args, kwargs))
+            return worker, job_id
+
+    def conversion_stream(self, *args, **kwargs):
+        # 参数与 conversion_stream 相同：target 为第 5 个参数，f0_condition 为第 9 个参数
+        target = args[4] if len(args) > 4 else kwargs.get("target")
+        f0_condition = args[8] if len(args) > 8 else kwargs.get("f0_condition")
+        voice_key = voice_cache_key(target, f0_condition) if target else None
+        kwargs.setdefault("submit_time", time.time())
+        results = queue.Queue()
+        worker, job_id = self._submit(vc_model_name(f0_condition), voice_key, args, kwargs, results)
+        finished = False
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    finished = True
+                    return
+                if isinstance(item, Exception):
+                    finished = True
+                    raise item
+                yield item
+        finally:
+            if not finished:
+                # 客户端断开或出错时通知推理进程停止该请求
+                worker["jobs"].put(("cancel", job_id))
+
+    def stats(self):
+        with self.lock:
+            return [{"id": w["id"], "pid": w["pid"], "ready": w["ready"].is_set(),
+                     "alive": w["process"] is not None and w["process"].is_alive(), "failed": w["failed"],
+                     "queue_depth": w["depth"], "served": w["served"],
+                     "models": list(w["models"]), "cached_voices": len(w["voices"])} for w in self.workers]
+
+
+worker_pool = None
+
+
+# 默认的edge tts音色，界面使用 refresh_tts_speakers 在后台获取并缓存的全部音色，没有缓存时使用
 tts_speakers = ['zh-HK-HiuGaaiNeural-Female', 'zh-HK-HiuMaanNeural-Female', 'zh-HK-WanLungNeural-Male',
                 'zh-CN-XiaoxiaoNeural-Female', 'zh-CN-XiaoyiNeural-Female', 'zh-CN-YunjianNeural-Male',
                 'zh-CN-YunxiNeural-Male', 'zh-CN-YunxiaNeural-Male', 'zh-CN-YunyangNeural-Male',
@@ -399,7 +2026,407 @@ tts_speakers = ['zh-HK-HiuGaaiNeural-Female', 'zh-HK-HiuMaanNeural-Female', 'zh-
                 'ko-KR-SunHiNeural-Female']
 
 
+# 批量合成：从 JSONL/CSV 读取多行文本，Edge TTS 并发预取，模型按顺序逐行转换，已存在的输出会跳过，可中断后继续
+batch_tts_concurrency = 4  # 同时进行的 Edge TTS 请求数量
+batch_defaults = {"voice": "zh-CN-YunjianNeural-Male", "speed": -10, "pitch": 0, "reference": None,
+                  "diffusion_steps": 10, "length_adjust": 1.0, "inference_cfg_rate": 0.7, "f0_condition": False,
+                  "auto_f0_adjust": True, "pitch_shift": 0}
+
+
+def read_batch_rows(path):
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            raw_rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            raw_rows = [json.loads(line) for line in f if line.strip()]
+    # 参数错误的行不会进入合成，返回 (可以合成的行, 出错的行号)，错误原因逐行打印
+    rows = []
+    invalid = []
+    for i, raw in enumerate(raw_rows):
+        row_id = str(raw.get("id") or f"{i:06d}") if isinstance(raw, dict) else f"{i:06d}"
+        try:
+            row = parse_batch_row(raw)
+        except ValueError as e:
+            print(f"[batch] row {row_id} invalid: {e}")
+            invalid.append(row_id)
+            continue
+        row["id"] = row_id
+        rows.append(row)
+    return rows, invalid
+
+
+def parse_batch_row(raw):
+    if not isinstance(raw, dict):
+        raise ValueError("row must be a JSON object")
+    row = parse_request_params(raw)
+    if not isinstance(row.get("text"), str) or not row["text"].strip():
+        raise ValueError("text is required")
+    if not isinstance(row["reference"], str):
+        raise ValueError("reference is required (set the column or batch_defaults['reference'])")
+    if not os.path.exists(row["reference"]):
+        raise ValueError(f"reference {row['reference']} not found")
+    return row
+
+
+def parse_bool(name, value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "yes"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"{name} must be a boolean")
+
+
+def parse_number(name, value, cast, minimum=None, exclusive=False):
+    # 参数类型或范围错误时抛出 ValueError，接口返回 400
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number") from None
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be finite")
+    if minimum is not None and (value <= minimum if exclusive else value < minimum):
+        raise ValueError(f"{name} must be {'>' if exclusive else '>='} {minimum}")
+    return value
+
+
+def parse_request_params(raw):
+    row = dict(batch_defaults)
+    row.update({k: v for k, v in raw.items() if v not in (None, "")})
+    for k in ("speed", "pitch", "pitch_shift"):
+        row[k] = parse_number(k, row[k], int)
+    row["diffusion_steps"] = parse_number("diffusion_steps", row["diffusion_steps"], int, 1)
+    row["length_adjust"] = parse_number("length_adjust", row["length_adjust"], float, 0, exclusive=True)
+    row["inference_cfg_rate"] = parse_number("inference_cfg_rate", row["inference_cfg_rate"], float, 0)
+    for k in ("f0_condition", "auto_f0_adjust"):
+        row[k] = parse_bool(k, row[k])
+    # 以下参数只有接口使用，不传时由 conversion_stream 使用全局默认值；first_chunk_seconds 为 0 时每块都使用最大窗口
+    row["pipelined"] = parse_bool("pipelined", row.get("pipelined", False))
+    if row.get("first_chunk_seconds") is not None:
+        row["first_chunk_seconds"] = parse_number("first_chunk_seconds", row["first_chunk_seconds"], float, 0)
+    if row.get("chunk_growth") is not None:
+        row["chunk_growth"] = parse_number("chunk_growth", row["chunk_growth"], float, 1)
+    if not isinstance(row["voice"], str):
+        raise ValueError("voice must be a string")
+    # 音色可以写成界面中的 "zh-CN-YunjianNeural-Male"，也可以直接写 "zh-CN-YunjianNeural"
+    if row["voice"].endswith(("-Male", "-Female")):
+        row["voice"] = "-".join(row["voice"].split("-")[:-1])
+    return row
+
+
+def batch_tts_fetch(row):
+    start_time = time.time()
+    edge_key, edge_bytes = edge_tts_synthesize(row["text"], row["voice"], f"{row['speed']:+d}%", f"{row['pitch']:+d}Hz")
+    return edge_bytes, time.time() - start_time
+
+
+def batch_synthesize(input_path, output_dir, output_format="wav", tts_concurrency=None):
+    tts_concurrency = tts_concurrency or batch_tts_concurrency
+    os.makedirs(output_dir, exist_ok=True)
+    rows, invalid = read_batch_rows(input_path)
+    pending = [row for row in rows
+               if not os.path.exists(os.path.join(output_dir, f"{row['id']}.{output_format}"))]
+    print(f"[batch] {len(rows) + len(invalid)} rows, {len(invalid)} invalid, {len(rows) - len(pending)} already done, "
+          f"{len(pending)} to synthesize")
+
+    stage_times = {"tts": 0.0, "tts_wait": 0.0, "voice_features": 0.0, "load": 0.0, "convert": 0.0, "write": 0.0}
+    audio_seconds = 0.0
+    done = 0
+    failed = []
+    batch_start_time = time.time()
+    tts_executor = ThreadPoolExecutor(max_workers=tts_concurrency)
+    try:
+        # 最多提前提交 2 倍并发数的 TTS 请求，避免一次性把全部音频读入内存
+        tts_futures = deque()
+        next_submit = 0
+        for row in pending:
+            while next_submit < len(pending) and len(tts_futures) < 2 * tts_concurrency:
+                tts_futures.append(tts_executor.submit(batch_tts_fetch, pending[next_submit]))
+                next_submit += 1
+            tts_future = tts_futures.popleft()
+            try:
+                wait_start_time = time.time()
+                edge_bytes, tts_time = tts_future.result()
+                stage_times["tts_wait"] += time.time() - wait_start_time
+                stage_times["tts"] += tts_time
+
+                sr = 22050 if not row["f0_condition"] else 44100
+                stage_start_time = time.time()
+                # 同一参考音频的特征由音色缓存复用
+                voice_features = get_voice_features(row["reference"], row["f0_condition"])
+                stage_times["voice_features"] += time.time() - stage_start_time
+
+                stage_start_time = time.time()
+                source_audio = AudioFrontend.decode(edge_bytes)
+                stage_times["load"] += time.time() - stage_start_time
+
+                # 每块转换完成后直接写入输出文件
+                output_sink = OutputSink(sr, output_format, os.path.join(output_dir, f"{row['id']}.{output_format}"))
+                row_seconds = 0.0
+                write_time = 0.0
+                try:
+                    stage_start_time = time.time()
+                    for output_wave, _ in convert_audio(source_audio, voice_features, row["diffusion_steps"],
+                                                        row["length_adjust"], row["inference_cfg_rate"],
+                                                        row["f0_condition"], row["auto_f0_adjust"],
+                                                        row["pitch_shift"], first_chunk_seconds=0):
+                        write_start_time = time.time()
+                        output_sink.write(output_wave)
+                        write_time += time.time() - write_start_time
+                        row_seconds += len(output_wave) / sr
+                    write_start_time = time.time()
+                    output_sink.close()
+                    write_time += time.time() - write_start_time
+                except BaseException:
+                    output_sink.abort()
+                    raise
+                stage_times["convert"] += time.time() - stage_start_time - write_time
+                stage_times["write"] += write_time
+                audio_seconds += row_seconds
+                done += 1
+            except Exception:
+                print(f"[batch] row {row['id']} failed")
+                print(traceback.format_exc())
+                failed.append(row["id"])
+    finally:
+        tts_executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.time() - batch_start_time
+    print(f"[batch] {done} done, {len(failed)} failed in {elapsed:.2f}s, "
+          f"{done / elapsed if elapsed > 0 else 0:.2f} items/s, {audio_seconds:.1f}s audio, "
+          f"rtf {elapsed / audio_seconds if audio_seconds > 0 else 0:.3f}")
+    print("[batch] stage time " + ", ".join(f"{k}={v:.2f}s" for k, v in stage_times.items()))
+    if invalid:
+        print(f"[batch] invalid rows: {invalid}, fix them and run again")
+    if failed:
+        print(f"[batch] failed rows: {failed}, run again to retry")
+    return invalid + failed
+
+
+# 流式接口：不经过 Gradio，HTTP 分块传输或 WebSocket 二进制消息逐块返回编码后的音频
+# 下一块在当前块发送完成后才取出，客户端读得慢时推理也随之暂停；客户端断开后当前块完成即停止推理
+api_port = None  # None 表示界面模式下不启动；--api-only 未指定 --api-port 时使用 api_default_port
+api_default_port = 7862
+api_host = "127.0.0.1"  # 只监听本机，需要对外提供服务时改为 "0.0.0.0"
+api_reference_dir = "./references"  # 参数 reference 为该目录下的文件名，也可以用 reference_base64 直接上传参考音频
+api_upload_dir = "./checkpoints/api_references"
+api_max_reference_bytes = 20 * 1024 * 1024  # 上传的参考音频解码后的大小上限
+api_keep_uploads = 100  # api_upload_dir 中最多保留的参考音频数量，超出时删除最久未使用的
+# pcm 为 16 位有符号小端（s16le）单声道裸数据，audio/L16 规定为大端，因此不使用
+api_media_types = {"pcm": "application/octet-stream", "opus": "audio/ogg", "mp3": "audio/mpeg"}
+
+
+def prune_api_uploads():
+    files = [os.path.join(api_upload_dir, name) for name in os.listdir(api_upload_dir) if not name.endswith(".tmp")]
+    if len(files) <= api_keep_uploads:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - api_keep_uploads]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def api_reference_path(raw):
+    if raw.get("reference_base64"):
+        encoded = raw["reference_base64"]
+        if not isinstance(encoded, str):
+            raise ValueError("reference_base64 must be a string")
+        # 先按编码长度拒绝过大的上传，避免解码出大块内存
+        if len(encoded) > (api_max_reference_bytes + 2) // 3 * 4 + 4:
+            raise ValueError(f"reference_base64 exceeds {api_max_reference_bytes} bytes")
+        audio_bytes = base64.b64decode(encoded, validate=True)
+        if not audio_bytes:
+            raise ValueError("reference_base64 is empty")
+        if len(audio_bytes) > api_max_reference_bytes:
+            raise ValueError(f"reference_base64 exceeds {api_max_reference_bytes} bytes")
+        # 按内容命名，同一参考音频只保存一次，音色缓存也能命中
+        path = os.path.join(api_upload_dir, hashlib.sha256(audio_bytes).hexdigest())
+        if os.path.exists(path):
+            # 更新修改时间，清理时按最久未使用删除
+            os.utime(path)
+        else:
+            os.makedirs(api_upload_dir, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio_bytes)
+            os.replace(tmp_path, path)
+            prune_api_uploads()
+        return path
+    if not raw.get("reference"):
+        raise ValueError("reference or reference_base64 is required")
+    if not isinstance(raw["reference"], str):
+        raise ValueError("reference must be a string")
+    path = os.path.join(api_reference_dir, os.path.basename(raw["reference"]))
+    if not os.path.exists(path):
+        raise ValueError(f"reference {raw['reference']} not found")
+    return path
+
+
+def api_conversion(raw):
+    # 参数与批量合成的每一行相同，另外支持 pipelined、first_chunk_seconds、chunk_growth 和 format
+    if not isinstance(raw, dict):
+        raise ValueError("request must be a JSON object")
+    if not raw.get("text"):
+        raise ValueError("text is required")
+    if not isinstance(raw["text"], str):
+        raise ValueError("text must be a string")
+    stream_format = raw.get("format", "pcm")
+    if stream_format not in api_media_types:
+        raise ValueError(f"format must be one of {list(api_media_types)}")
+    if stream_format != "pcm" and shutil.which(AudioSegment.converter) is None:
+        raise ValueError(f"format {stream_format} requires ffmpeg, which is not available; use pcm")
+    row = parse_request_params(raw)
+    row["reference"] = api_reference_path(raw)
+    conversion = worker_pool.conversion_stream if worker_pool is not None else conversion_stream
+    stream = conversion(row["text"], row["voice"], row["speed"], row["pitch"], row["reference"],
+                        row["diffusion_steps"], row["length_adjust"], row["inference_cfg_rate"], row["f0_condition"],
+                        row["auto_f0_adjust"], row["pitch_shift"], row["pipelined"],
+                        row.get("first_chunk_seconds"), row.get("chunk_growth"), stream_format=stream_format,
+                        full_output=False, submit_time=time.time())
+    sr = 22050 if not row["f0_condition"] else 44100
+    return stream, sr, stream_format
+
+
+async def api_next_chunk(stream):
+    # 在线程池中取下一块，返回 None 表示结束；推理出错时抛出异常
+    from starlette.concurrency import run_in_threadpool
+
+    item = await run_in_threadpool(next, stream, None)
+    if item is None:
+        return None
+    if item[1] is None:
+        raise RuntimeError("conversion failed")
+    return item[1]
+
+
+def create_api():
+    from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import StreamingResponse
+
+    api = FastAPI(title="Seed VC Edge TTS")
+    limit = {}
+
+    def semaphore():
+        # 与界面相同的并发上限，超出的请求排队等待
+        if "semaphore" not in limit:
+            limit["semaphore"] = asyncio.Semaphore(request_concurrency * max(1, serve_workers))
+        return limit["semaphore"]
+
+    @api.post("/convert")
+    async def convert(request: Request):
+        try:
+            stream, sr, stream_format = api_conversion(await request.json())
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        async def body():
+            try:
+                async with semaphore():
+                    while True:
+                        chunk = await api_next_chunk(stream)
+                        if chunk is None:
+                            break
+                        if chunk:
+                            yield chunk
+            finally:
+                # 客户端断开时 starlette 取消该任务，等正在推理的块返回后关闭生成器，停止后续推理
+                stream.close()
+
+        return StreamingResponse(body(), media_type=api_media_types[stream_format], headers={"X-Sample-Rate": str(sr)})
+
+    @api.websocket("/ws/convert")
+    async def ws_convert(websocket: WebSocket):
+        # 客户端先发送一条 JSON 参数，之后收到二进制音频消息，最后收到 {"status": "done"} 或 {"status": "error"}
+        await websocket.accept()
+        try:
+            stream, sr, stream_format = api_conversion(await websocket.receive_json())
+        except (ValueError, KeyError, TypeError) as e:
+            await websocket.send_json({"status": "error", "detail": str(e)})
+            await websocket.close()
+            return
+        except WebSocketDisconnect:
+            return
+        await websocket.send_json({"status": "start", "sample_rate": sr, "format": stream_format})
+        disconnected = asyncio.ensure_future(websocket.receive())
+        try:
+            async with semaphore():
+                while True:
+                    next_chunk = asyncio.ensure_future(api_next_chunk(stream))
+                    await asyncio.wait([next_chunk, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                    if disconnected.done():
+                        # 推理中的块无法中断，等它返回后关闭生成器
+                        await asyncio.wait([next_chunk])
+                        return
+                    try:
+                        chunk = next_chunk.result()
+                    except RuntimeError as e:
+                        await websocket.send_json({"status": "error", "detail": str(e)})
+                        return
+                    if chunk is None:
+                        await websocket.send_json({"status": "done"})
+                        await websocket.close()
+                        return
+                    if chunk:
+                        await websocket.send_bytes(chunk)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            disconnected.cancel()
+            stream.close()
+
+    return api
+
+
+def check_api_dependencies():
+    # 流式接口的依赖是可选的，缺少时在启动任何服务之前给出明确的提示
+    try:
+        import fastapi
+        import uvicorn
+    except ImportError as e:
+        raise SystemExit(f"[api] the streaming API requires fastapi and uvicorn ({e.name} is not installed), "
+                         f"install them with: pip install -r requirements.txt")
+
+
+def start_api_server(port, block=False):
+    check_api_dependencies()
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_api(), host=api_host, port=port, log_level="warning"))
+    print(f"[api] serving http://{api_host}:{port}/convert and ws://{api_host}:{port}/ws/convert")
+    if block:
+        server.run()
+    else:
+        threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def start_services():
+    global worker_pool
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+    if serve_workers > 0:
+        worker_pool = WorkerPool(serve_workers)
+        print(f"[startup] ready in {time.time() - startup_time:.2f}s (starting {serve_workers} workers in background)")
+    else:
+        # 后台预加载模型，界面无需等待模型加载即可启动
+        def preload():
+            models.preload(preload_models)
+            print(f"[startup] models {preload_models} ready in {time.time() - startup_time:.2f}s")
+
+        threading.Thread(target=preload, daemon=True).start()
+        print(f"[startup] ready in {time.time() - startup_time:.2f}s (preloading {preload_models} in background)")
+
+
 def app():
+    threading.Thread(target=refresh_tts_speakers, daemon=True).start()
     with gr.Blocks(title="Seed VC Edge TTS") as demo:
         with gr.Row():
             gr.Markdown(value="""<h1>Seed VC Edge TTS</h1>
@@ -409,7 +2436,7 @@ def app():
                 tts_text = gr.Textbox(label="Input Text / 输入文本", lines=5, value="这是一个示例文本")
                 tts_choice = gr.Dropdown(
                     label="Edge TTS Speaker / Edge TTS 音色",
-                    choices=tts_speakers,
+                    choices=load_tts_speakers(),
                     allow_custom_value=False,
                     value="zh-CN-YunjianNeural-Male"
                 )
@@ -443,6 +2470,14 @@ def app():
                                              info="Roughly adjust F0 to match target voice. Only works when F0 conditioned model is used. / 粗略调整 F0 以匹配目标音色，仅在勾选 '启用F0输入' 时生效")
                 pitch_shift = gr.Slider(label='Pitch shift / 音调变换', minimum=-24, maximum=24, step=1, value=0,
                                         info="Pitch shift in semitones, only works when F0 conditioned model is used / 半音数的音高变换，仅在勾选 '启用F0输入' 时生效")
+                pipelined = gr.Checkbox(label="Pipelined / 分句流水线", value=False,
+                                        info="Synthesize and convert sentence by sentence for faster first audio / 逐句合成与转换，更快输出第一段音频")
+                first_chunk = gr.Slider(label="First chunk (s) / 首块长度(秒)", minimum=0, maximum=30, step=0.5,
+                                        value=first_chunk_seconds,
+                                        info="Smaller first chunk gives faster first audio, 0 uses full chunks / 越小第一段音频越快输出，0 表示每块都使用最大长度")
+                chunk_growth_rate = gr.Slider(label="Chunk growth / 分块增长倍数", minimum=1.0, maximum=4.0, step=0.5,
+                                              value=chunk_growth,
+                                              info="Each following chunk grows by this factor up to the context limit / 之后每块按该倍数增长，直到上下文长度上限")
             with gr.Column():
                 reference_audio = gr.Audio(type="filepath", label="Reference Audio / 参考音频")
                 edge_tts_output = gr.Audio(type="filepath", label="Edge TTS Audio / Edge TTS 音频")
@@ -450,15 +2485,42 @@ def app():
                 full_audio_output = gr.Audio(label="Full Output Audio / 完整输出", streaming=False, format='wav')
                 submit_btn = gr.Button(value="推理", variant='primary')
 
+        # 页面加载时读取后台更新后的音色列表
+        demo.load(lambda: gr.Dropdown(choices=load_tts_speakers()), outputs=tts_choice)
         submit_btn.click(voice_conversion,
                          inputs=[tts_text, tts_choice, tts_speed, tts_pitch, reference_audio, diffusion_steps,
                                  length_adjust,
                                  inference_cfg_rate,
                                  f0_condition, auto_f0_adjust,
-                                 pitch_shift], outputs=[edge_tts_output, stream_audio_output, full_audio_output])
+                                 pitch_shift, pipelined, first_chunk, chunk_growth_rate], outputs=[edge_tts_output, stream_audio_output, full_audio_output],
+                         concurrency_limit=request_concurrency * max(1, serve_workers))
 
+    start_services()
+    if api_port is not None:
+        start_api_server(api_port)
     demo.queue(api_open=True).launch(debug=True, show_error=True)
 
 
 if __name__ == "__main__":
-    app()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", help="JSONL/CSV 文件，批量合成而不启动界面")
+    parser.add_argument("--output-dir", default="./outputs")
+    parser.add_argument("--format", default="wav", choices=["wav", "flac", "mp3"])
+    parser.add_argument("--tts-concurrency", type=int, default=batch_tts_concurrency)
+    parser.add_argument("--workers", type=int, default=serve_workers, help="推理进程数量，0 表示在界面进程中推理")
+    parser.add_argument("--api-only", action="store_true", help="只启动流式接口，不启动界面")
+    parser.add_argument("--api-port", type=int, default=api_port, help="指定后在界面之外同时启动流式接口")
+    parser.add_argument("--api-host", default=api_host)
+    args = parser.parse_args()
+    serve_workers = args.workers
+    api_port = args.api_port
+    api_host = args.api_host
+    if not args.batch and (args.api_only or api_port is not None):
+        check_api_dependencies()
+    if args.batch:
+        batch_synthesize(args.batch, args.output_dir, args.format, args.tts_concurrency)
+    elif args.api_only:
+        start_services()
+        start_api_server(api_port or api_default_port, block=True)
+    else:
+        app()
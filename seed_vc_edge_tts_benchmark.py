@@ -0,0 +1,623 @@
+# 离线性能基准：用本地生成的音频代替 Edge TTS，用同结构的小型随机初始化模型代替预训练模型，
+# 不需要网络和 GPU，按文本长度、扩散步数和 F0 条件扫描，结果可保存为 JSON 并与上一次结果比较
+# python seed_vc_edge_tts_benchmark.py --output bench.json
+# python seed_vc_edge_tts_benchmark.py --baseline bench.json
+import argparse
+import asyncio
+import functools
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import librosa
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+import yaml
+from pydub import AudioSegment
+from transformers import WhisperFeatureExtractor
+
+import seed_vc_edge_tts as vc
+
+# 与 seed vc 预设配置相同的模型结构，只缩小宽度和层数
+dit_configs = {False: "configs/presets/config_dit_mel_seed_uvit_whisper_small_wavenet.yml",
+               True: "configs/presets/config_dit_mel_seed_uvit_whisper_base_f0_44k.yml"}
+small_dim = 64
+sample_text = "这是一个用于性能测试的示例文本，包含常见的标点符号。"
+
+
+def synthetic_speech(seconds, sr, seed=0):
+    # 带颤音和音节起伏的谐波信号，近似语音的基频变化和能量包络
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 160 + 30 * np.sin(2 * np.pi * 0.7 * t) + 5 * np.sin(2 * np.pi * 5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    wave = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    wave = 0.2 * wave * envelope + 0.005 * rng.randn(len(t))
+    return (wave * 32767).astype(np.int16)
+
+
+def encode_audio(wave, sr, fmt, path=None):
+    segment = AudioSegment(wave.tobytes(), frame_rate=sr, sample_width=2, channels=1)
+    if path is not None:
+        segment.export(path, format=fmt)
+        return path
+    buffer = segment.export(format=fmt)
+    return buffer.read()
+
+
+def fake_edge_tts_audio(text_length, seconds_per_char):
+    # 与 Edge TTS 一样只输出 mp3 帧，不带 Xing/ID3 头，多段音频可以直接拼接
+    segment = AudioSegment(synthetic_speech(max(0.5, seconds_per_char * text_length), 24000, seed=text_length).tobytes(),
+                           frame_rate=24000, sample_width=2, channels=1)
+    return segment.export(format="mp3", parameters=["-write_xing", "0", "-id3v2_version", "0"]).read()
+
+
+def install_fake_edge_tts(seconds_per_char, latency):
+    # 每个字约 seconds_per_char 秒，latency 模拟网络往返
+    async def fake_edge_tts_stream(text, voice, rate, pitch):
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return fake_edge_tts_audio(len(text), seconds_per_char)
+
+    vc.edge_tts_stream = fake_edge_tts_stream
+
+
+def start_mock_edge_tts_server(seconds_per_char, latency, failure_rate, speed):
+    # 本地的 Edge TTS websocket 服务，使用与真实服务相同的消息格式，让 seed_vc_edge_tts 中的客户端走完整的请求流程
+    # 音频按每秒生成 speed 秒的速度分块发送，failure_rate 的请求直接断开连接，用于测试超时和重试
+    from aiohttp import web
+
+    # 按文本长度缓存编码结果，本地编码耗时不计入模拟的服务耗时
+    @functools.lru_cache(maxsize=256)
+    def mock_audio(text_length):
+        return fake_edge_tts_audio(text_length, seconds_per_char)
+
+    def text_message(path):
+        return f"X-RequestId:mock\r\nContent-Type:application/json; charset=utf-8\r\nPath:{path}\r\n\r\n{{}}"
+
+    def audio_message(data):
+        headers = b"X-RequestId:mock\r\nContent-Type:audio/mpeg\r\nPath:audio\r\n"
+        return len(headers).to_bytes(2, "big") + headers + data
+
+    async def tts(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if "Path:ssml" not in message.data:
+                continue
+            if random.random() < failure_rate:
+                break
+            text = re.search(r"<prosody[^>]*>(.*?)</prosody>", message.data, re.S).group(1).strip()
+            audio = await asyncio.get_running_loop().run_in_executor(None, mock_audio, len(text))
+            if latency > 0:
+                await asyncio.sleep(latency)
+            try:
+                await ws.send_str(text_message("turn.start"))
+                chunk_seconds = max(0.5, seconds_per_char * len(text)) / speed * 4096 / len(audio)
+                for i in range(0, len(audio), 4096):
+                    await asyncio.sleep(chunk_seconds)
+                    await ws.send_bytes(audio_message(audio[i:i + 4096]))
+                await ws.send_str(text_message("turn.end"))
+            except ConnectionResetError:
+                # 客户端超时或取消后已断开
+                pass
+            break
+        await ws.close()
+        return ws
+
+    async def voices(request):
+        return web.json_response([{"ShortName": voice.rsplit("-", 1)[0], "Gender": voice.rsplit("-", 1)[1]}
+                                  for voice in vc.tts_speakers])
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get("/tts", tts)
+    app.router.add_get("/voices", voices)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}/tts?TrustedClientToken=mock"
+
+
+def install_mock_edge_tts(seconds_per_char, latency, failure_rate, speed):
+    http_url, ws_url = start_mock_edge_tts_server(seconds_per_char, latency, failure_rate, speed)
+    vc.edge_proxy = None
+    vc.edge_tts_url = ws_url
+    vc.edge_tts_voices_url = f"{http_url}/voices"
+    print(f"[bench] mock edge tts at {ws_url}")
+
+
+def benchmark_edge_tts(args):
+    # 不经过缓存，直接比较 Edge TTS 客户端在不同文本长度下的耗时，长文本分段并行请求
+    for text_length in args.text_lengths:
+        text = (sample_text * (text_length // len(sample_text) + 1))[:text_length]
+        times = []
+        for _ in range(args.repeat):
+            start_time = time.time()
+            vc.edge_tts_client.submit(text, "zh-CN-YunjianNeural", "+0%", "+0Hz").result()
+            times.append(time.time() - start_time)
+        print(f"[bench] edge_tts chars={text_length:4d} total={np.median(times):.3f}s")
+    # 并发请求
+    start_time = time.time()
+    futures = [vc.edge_tts_client.submit(sample_text * 2, "zh-CN-YunjianNeural", f"{i:+d}%", "+0Hz")
+               for i in range(args.tts_concurrent_requests)]
+    for future in futures:
+        future.result()
+    print(f"[bench] edge_tts {args.tts_concurrent_requests} concurrent requests in {time.time() - start_time:.3f}s")
+    print(f"[bench] edge_tts {vc.edge_tts_client.stats()}")
+
+
+def load_small_common_models():
+    from modules.campplus.DTDNN import CAMPPlus
+    from transformers import WhisperConfig, WhisperFeatureExtractor, WhisperModel
+
+    campplus_model = CAMPPlus(feat_dim=80, embedding_size=192).eval().to(vc.device)
+    whisper_config = WhisperConfig(d_model=small_dim, encoder_layers=2, encoder_attention_heads=2,
+                                   encoder_ffn_dim=small_dim * 4, decoder_layers=1, decoder_attention_heads=2,
+                                   decoder_ffn_dim=small_dim * 4)
+    whisper_model = WhisperModel(whisper_config).to(vc.whisper_dtype()).to(vc.device)
+    del whisper_model.decoder
+    return vc.optimize_common_models({"campplus_model": campplus_model, "whisper_model": whisper_model,
+                                      "whisper_feature_extractor": WhisperFeatureExtractor()})
+
+
+def load_small_vc_models(f0_condition, work_dir):
+    from modules.audio import mel_spectrogram
+    from modules.bigvgan import bigvgan
+    from modules.bigvgan.env import AttrDict
+    from modules.commons import build_model, recursive_munch
+
+    config = yaml.safe_load(open(dit_configs[f0_condition], "r"))
+    model_params = config["model_params"]
+    model_params["length_regulator"].update(in_channels=small_dim, channels=small_dim)
+    model_params["DiT"].update(hidden_dim=small_dim, num_heads=2, depth=3, content_dim=small_dim)
+    model_params["wavenet"].update(hidden_dim=small_dim, num_layers=2)
+    model = build_model(recursive_munch(model_params), stage="DiT")
+    for key in model:
+        model[key].eval()
+        model[key].to(vc.device)
+    model.cfm.estimator.setup_caches(max_batch_size=2 * vc.cfm_max_batch_size, max_seq_length=8192)
+    if hasattr(model.cfm.estimator, "wavenet"):
+        vc.install_rowwise_wavenet(model.cfm.estimator.wavenet)
+
+    spect_params = config["preprocess_params"]["spect_params"]
+    mel_fn_args = {
+        "n_fft": spect_params["n_fft"],
+        "win_size": spect_params["win_length"],
+        "hop_size": spect_params["hop_length"],
+        "num_mels": spect_params["n_mels"],
+        "sampling_rate": config["preprocess_params"]["sr"],
+        "fmin": 0,
+        "fmax": None,
+        "center": False
+    }
+    to_mel = lambda x: mel_spectrogram(x, **mel_fn_args)
+
+    # 上采样倍数与原 BigVGAN 相同（22k 为 256，44k 为 512），只缩小通道数
+    h = AttrDict(num_mels=spect_params["n_mels"], upsample_initial_channel=small_dim, resblock="1",
+                 upsample_rates=[8, 8, 4, 2] if f0_condition else [8, 8, 2, 2],
+                 upsample_kernel_sizes=[16, 16, 8, 4] if f0_condition else [16, 16, 4, 4],
+                 resblock_kernel_sizes=[3], resblock_dilation_sizes=[[1, 3, 5]], activation="snakebeta",
+                 snake_logscale=True, use_tanh_at_final=False, use_bias_at_final=False)
+    bigvgan_model = bigvgan.BigVGAN(h, use_cuda_kernel=False)
+    bigvgan_model.remove_weight_norm()
+    bigvgan_model = bigvgan_model.eval().to(vc.device)
+
+    vc_models = {"model": model, "to_mel": to_mel, "bigvgan_model": bigvgan_model}
+    if f0_condition:
+        # RMVPE 的结构在类中固定，使用随机初始化的完整模型
+        from modules.rmvpe import E2E, RMVPE
+
+        rmvpe_path = os.path.join(work_dir, "rmvpe_random.pt")
+        if not os.path.exists(rmvpe_path):
+            torch.save(E2E(4, 1, (2, 2)).state_dict(), rmvpe_path)
+        vc_models["rmvpe"] = RMVPE(rmvpe_path, is_half=False, device=vc.device)
+    return vc.optimize_vc_models(vc_models)
+
+
+def install_models(work_dir, pretrained=False):
+    # pretrained 时使用 seed_vc_edge_tts 中的预训练模型（需要已下载或可以联网），否则使用小型随机模型
+    if pretrained:
+        vc.models = vc.ModelRegistry({
+            "common": vc.load_common_models,
+            "22k": lambda: vc.load_vc_models(False),
+            "f0_44k": lambda: vc.load_vc_models(True),
+        })
+    else:
+        vc.models = vc.ModelRegistry({
+            "common": load_small_common_models,
+            "22k": lambda: load_small_vc_models(False, work_dir),
+            "f0_44k": lambda: load_small_vc_models(True, work_dir),
+        })
+    vc.voice_cache = vc.VoiceCache(vc.voice_cache_size, os.path.join(work_dir, "voice_cache"))
+    # Edge TTS 磁盘缓存每次清空，不同次运行的结果可以比较
+    shutil.rmtree(os.path.join(work_dir, "edge_tts_cache"), ignore_errors=True)
+    vc.edge_tts_cache = vc.EdgeTTSCache(vc.edge_tts_cache_max_bytes, os.path.join(work_dir, "edge_tts_cache"),
+                                        vc.edge_tts_cache_max_disk_bytes)
+
+
+def run_once(text, reference, diffusion_steps, f0_condition, stream_format, return_wave=False):
+    full_output = None
+    for _, _, full_output in vc.voice_conversion(text, "zh-CN-YunjianNeural-Male", -10, 0, reference,
+                                                 diffusion_steps, 1.0, 0.7, f0_condition, True, 0,
+                                                 stream_format=stream_format):
+        pass
+    if return_wave:
+        return vc.recent_metrics[-1], sf.read(full_output, dtype="float32")[0]
+    return vc.recent_metrics[-1]
+
+
+def memory_run(args, text_length, pipelined, results):
+    # 在新进程中运行，进程内存峰值只包含这一次转换
+    reference = setup_environment(args)
+    f0_condition = bool(args.f0_condition[0])
+    run_once(sample_text, reference, args.diffusion_steps[0], f0_condition, args.stream_format)
+    base_mb = vc.memory_mb()
+    text = (sample_text * (text_length // len(sample_text) + 1))[:text_length]
+    full_output = None
+    for _, _, full_output in vc.voice_conversion(text, "zh-CN-YunjianNeural-Male", -10, 0, reference,
+                                                 args.diffusion_steps[0], 1.0, 0.7, f0_condition, True, 0, pipelined,
+                                                 stream_format=args.stream_format):
+        pass
+    results.put({"text_chars": text_length, "pipelined": pipelined, "audio_seconds": sf.info(full_output).duration,
+                 "base_mb": base_mb, "peak_mb": vc.memory_mb()})
+
+
+def memory_report(args):
+    # 每个文本长度在单独的进程中运行，比较进程内存峰值；分句流水线时输入特征也按句计算，峰值应与文本长度无关
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    for pipelined in (True, False):
+        for text_length in args.text_lengths:
+            results = ctx.Queue()
+            process = ctx.Process(target=memory_run, args=(args, text_length, pipelined, results))
+            process.start()
+            result = results.get()
+            process.join()
+            print(f"[bench] memory pipelined={int(pipelined)} chars={text_length:5d} "
+                  f"audio={result['audio_seconds']:7.1f}s peak={result['peak_mb']:.0f}MB "
+                  f"(+{result['peak_mb'] - result['base_mb']:.0f}MB over a short request)")
+
+
+def startup_run(args, preload, results):
+    # 在新进程中运行：模型首次加载为冷启动，全部卸载后再次加载为热启动
+    reference = setup_environment(args)
+    f0_condition = bool(args.f0_condition[-1])
+    names = ["common", vc.vc_model_name(f0_condition)]
+    start_time = time.time()
+    if preload:
+        vc.models.preload(names)
+    ready_seconds = time.time() - start_time
+    metrics = run_once(sample_text, reference, args.diffusion_steps[0], f0_condition, args.stream_format)
+    for name in names:
+        vc.models.unload(name)
+    vc.models.preload(names)
+    results.put({"ready_seconds": ready_seconds, "time_to_first_chunk": metrics["time_to_first_chunk"],
+                 "load_times": {name: dict(times) for name, times in vc.models.load_times.items()}})
+
+
+def startup_report(args):
+    # 预加载时就绪时间包含模型加载，第一次请求不需要等待；按需加载时第一次请求等待模型加载
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    for preload in (True, False):
+        results = ctx.Queue()
+        process = ctx.Process(target=startup_run, args=(args, preload, results))
+        process.start()
+        result = results.get()
+        process.join()
+        loads = " ".join(f"{name}=cold {times['cold']:.2f}s/warm {times['warm']:.2f}s"
+                         for name, times in result["load_times"].items())
+        print(f"[bench] startup preload={int(preload)} ready={result['ready_seconds']:.2f}s "
+              f"first_chunk={result['time_to_first_chunk']:.2f}s {loads}")
+
+
+# CPU 推理方案：每个方案与 fp32 比较各模块的速度和输出误差
+cpu_variants = {
+    "fp32": {},
+    "int8": {"cpu_quantize": ["whisper", "dit"]},
+    "bf16": {"cpu_bf16": True},
+    "compile": {"cpu_compile": True},
+    "channels_last": {"cpu_channels_last": True},
+    "int8_compile": {"cpu_quantize": ["whisper", "dit"], "cpu_compile": True},
+}
+
+
+def configure_cpu_variant(variant):
+    vc.cpu_quantize = []
+    vc.cpu_bf16 = False
+    vc.cpu_compile = False
+    vc.cpu_channels_last = False
+    for key, value in cpu_variants[variant].items():
+        setattr(vc, key, value)
+
+
+def relative_error(output, reference):
+    output = output.float().flatten()
+    reference = reference.float().flatten()
+    n = min(len(output), len(reference))
+    return float((output[:n] - reference[:n]).norm() / (reference[:n].norm() + 1e-8))
+
+
+def log_mel_distance(wave, reference, sr):
+    mel_fn = torchaudio.transforms.MelSpectrogram(sr, n_fft=1024, hop_length=256, n_mels=80)
+    n = min(len(wave), len(reference))
+    wave = torch.as_tensor(wave[:n]).float()
+    reference = torch.as_tensor(reference[:n]).float()
+    return float((torch.log(mel_fn(wave) + 1e-5) - torch.log(mel_fn(reference) + 1e-5)).abs().mean())
+
+
+def time_component(fn, repeat):
+    with torch.inference_mode():
+        output = fn()
+        times = []
+        for _ in range(repeat):
+            start_time = time.time()
+            output = fn()
+            times.append(time.time() - start_time)
+    return output, float(np.median(times))
+
+
+def cpu_report(args, reference):
+    f0_condition = bool(args.f0_condition[-1])
+    sr = 44100 if f0_condition else 22050
+    text = (sample_text * 4)[:args.text_lengths[0]]
+    inputs = None
+    baseline = {}
+    for variant in args.cpu_variants:
+        configure_cpu_variant(variant)
+        torch.manual_seed(0)
+        install_models(args.work_dir, args.pretrained)
+        # 参考音色特征不读磁盘缓存，每个方案都重新提取
+        vc.voice_cache = vc.VoiceCache(vc.voice_cache_size)
+        common_models = vc.models.get("common")
+        vc_models = vc.models.get(vc.vc_model_name(f0_condition))
+        cfm = vc_models["model"].cfm
+        if inputs is None:
+            # 各模块的输入用 fp32 模型生成一次，所有方案使用相同的输入
+            with torch.inference_mode():
+                source_audio = synthetic_speech(10, sr, seed=3).astype(np.float32) / 32768
+                voice_features = vc.extract_voice_features(reference, f0_condition)
+                source_audio = vc.AudioFrontend(torch.from_numpy(source_audio)[None], sr)
+                source_features = vc.extract_source_features(source_audio, f0_condition)
+                cond = vc_models["model"].length_regulator(
+                    source_features["S_alt"], ylens=torch.LongTensor([source_features["mel"].size(2)]),
+                    n_quantizers=3, f0=source_features["F0_alt"])[0]
+                inputs = {
+                    "waves_16k": source_audio.view(16000)[0],
+                    "cat_condition": torch.cat([voice_features["prompt_condition"], cond], dim=1),
+                    "mel2": voice_features["mel2"],
+                    "style2": voice_features["style2"],
+                    "mel": source_features["mel"],
+                }
+
+        def whisper():
+            return vc.whisper_encode(common_models["whisper_model"], common_models["whisper_feature_extractor"],
+                                     [inputs["waves_16k"]])
+
+        def dit():
+            torch.manual_seed(1)
+            with vc.autocast_context():
+                return cfm.inference(inputs["cat_condition"],
+                                     torch.LongTensor([inputs["cat_condition"].size(1)]),
+                                     inputs["mel2"], inputs["style2"], None, args.diffusion_steps[0],
+                                     inference_cfg_rate=0.7)
+
+        def bigvgan():
+            with vc.autocast_context(vocoder=True):
+                return vc_models["bigvgan_model"](inputs["mel"].float())[0]
+
+        components = {"whisper": whisper, "dit": dit, "bigvgan": bigvgan}
+        if f0_condition:
+            components["rmvpe"] = lambda: torch.from_numpy(
+                vc_models["rmvpe"].infer_from_audio(inputs["waves_16k"], thred=0.03))
+
+        report = []
+        for name, fn in components.items():
+            output, seconds = time_component(fn, args.repeat)
+            if variant == args.cpu_variants[0]:
+                baseline[name] = (output, seconds)
+            base_output, base_seconds = baseline[name]
+            report.append(f"{name}={seconds:.3f}s ({base_seconds / seconds:.2f}x, err={relative_error(output, base_output):.2e})")
+
+        # 完整流程：输出波形与 fp32 的相对误差和 log-mel 距离
+        run_once(text, reference, args.diffusion_steps[0], f0_condition, "pcm")
+        torch.manual_seed(2)
+        metrics, wave = run_once(text, reference, args.diffusion_steps[0], f0_condition, "pcm", return_wave=True)
+        if variant == args.cpu_variants[0]:
+            baseline["pipeline"] = (wave, metrics["total_time"])
+        base_wave, base_seconds = baseline["pipeline"]
+        report.append(f"pipeline={metrics['total_time']:.3f}s ({base_seconds / metrics['total_time']:.2f}x, "
+                      f"wave_err={relative_error(torch.from_numpy(wave), torch.from_numpy(base_wave)):.2e}, "
+                      f"mel_dist={log_mel_distance(wave, base_wave, sr):.3f})")
+        print(f"[bench] cpu {variant} f0={int(f0_condition)} bf16={vc.cpu_bf16_enabled()} threads={torch.get_num_threads()} "
+              + " ".join(report))
+
+
+def frontend_librosa(source_bytes, sr, feature_extractor):
+    # 之前的做法：解码时用 librosa 重采样到模型采样率，再每次重新计算重采样核得到 16k，log-mel 经过 numpy
+    source_wave = torch.tensor(librosa.load(io.BytesIO(source_bytes), sr=sr)[0]).unsqueeze(0)
+    waves_16k = torchaudio.functional.resample(source_wave, sr, 16000)
+    windows = [window.numpy() for window in vc.whisper_windows(waves_16k[0])]
+    features = feature_extractor(windows, return_tensors="pt", return_attention_mask=True, sampling_rate=16000)
+    return source_wave, waves_16k, features.input_features
+
+
+def frontend_unified(source_bytes, sr, feature_extractor):
+    audio = vc.AudioFrontend.decode(source_bytes)
+    waves_16k = audio.view(16000)
+    return audio.view(sr), waves_16k, vc.whisper_log_mel(feature_extractor, vc.whisper_windows(waves_16k[0]))[0]
+
+
+def frontend_report(args):
+    # 音频前端（解码、重采样、whisper log-mel）每秒音频的耗时，输入与 Edge TTS 相同为 24k mp3
+    feature_extractor = WhisperFeatureExtractor()
+    for f0_condition in [bool(f) for f in args.f0_condition]:
+        sr = 44100 if f0_condition else 22050
+        for seconds in args.frontend_seconds:
+            source_bytes = fake_edge_tts_audio(int(seconds / args.seconds_per_char), args.seconds_per_char)
+            old, old_seconds = time_component(lambda: frontend_librosa(source_bytes, sr, feature_extractor),
+                                              args.repeat)
+            new, new_seconds = time_component(lambda: frontend_unified(source_bytes, sr, feature_extractor),
+                                              args.repeat)
+            audio_seconds = old[0].size(-1) / sr
+            print(f"[bench] frontend f0={int(f0_condition)} audio={audio_seconds:5.1f}s "
+                  f"librosa={1000 * old_seconds / audio_seconds:.2f}ms/s "
+                  f"unified={1000 * new_seconds / audio_seconds:.2f}ms/s "
+                  f"speedup={old_seconds / new_seconds:.2f}x "
+                  f"wave_err={relative_error(new[0], old[0]):.2e} "
+                  f"16k_err={relative_error(new[1], old[1]):.2e} "
+                  f"log_mel_diff={float((new[2] - old[2]).abs().mean()):.2e}")
+
+
+def compare(results, baseline, tolerance):
+    baseline = {(r["text_chars"], r["diffusion_steps"], r["f0_condition"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["text_chars"], r["diffusion_steps"], r["f0_condition"]))
+        if old is None:
+            continue
+        for key in ("total_time", "time_to_first_chunk"):
+            if old[key] and r[key] > old[key] * (1 + tolerance):
+                regressions.append(f"text_chars={r['text_chars']} steps={r['diffusion_steps']} "
+                                   f"f0={r['f0_condition']} {key} {old[key]:.3f}s -> {r[key]:.3f}s")
+    return regressions
+
+
+def setup_environment(args):
+    torch.manual_seed(0)
+    os.makedirs(args.work_dir, exist_ok=True)
+    vc.device = torch.device(args.device)
+    vc.metrics_enabled = True
+    vc.output_dir = os.path.join(args.work_dir, "outputs")
+    vc.max_prompt_seconds = args.max_prompt_seconds
+    vc.first_chunk_seconds = args.first_chunk_seconds
+    vc.chunk_growth = args.chunk_growth
+    if args.edge_tts_mock:
+        install_mock_edge_tts(args.seconds_per_char, args.tts_latency, args.mock_failure_rate, args.mock_speed)
+    else:
+        install_fake_edge_tts(args.seconds_per_char, args.tts_latency)
+    if args.tts_report:
+        benchmark_edge_tts(args)
+        return None
+    install_models(args.work_dir, args.pretrained)
+    return encode_audio(synthetic_speech(args.reference_seconds, 22050, seed=1), 22050, "wav",
+                        os.path.join(args.work_dir, "reference.wav"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-lengths", type=int, nargs="+", default=[20, 80, 320])
+    parser.add_argument("--diffusion-steps", type=int, nargs="+", default=[5, 10, 25])
+    parser.add_argument("--f0-condition", type=int, nargs="+", default=[0, 1], choices=[0, 1])
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合运行的次数，取中位数")
+    parser.add_argument("--stream-format", default="mp3", choices=["mp3", "opus", "pcm"])
+    parser.add_argument("--seconds-per-char", type=float, default=0.22, help="模拟 Edge TTS 每个字的时长")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="模拟 Edge TTS 的网络延迟（秒）")
+    parser.add_argument("--edge-tts-mock", action="store_true",
+                        help="启动本地 Edge TTS websocket 服务，经过真实的 Edge TTS 客户端请求音频")
+    parser.add_argument("--mock-failure-rate", type=float, default=0.0, help="本地服务直接断开连接的比例")
+    parser.add_argument("--mock-speed", type=float, default=10.0, help="本地服务每秒生成的音频秒数")
+    parser.add_argument("--tts-report", action="store_true", help="只测试 Edge TTS 客户端，需要与 --edge-tts-mock 一起使用")
+    parser.add_argument("--tts-concurrent-requests", type=int, default=16)
+    parser.add_argument("--reference-seconds", type=float, default=5.0)
+    parser.add_argument("--max-prompt-seconds", type=float, default=None, help="只用参考音频的前若干秒作为提示")
+    parser.add_argument("--first-chunk-seconds", type=float, default=vc.first_chunk_seconds,
+                        help="第一块的长度，0 表示每块都使用最大长度")
+    parser.add_argument("--chunk-growth", type=float, default=vc.chunk_growth)
+    parser.add_argument("--cpu-report", action="store_true",
+                        help="比较各 CPU 推理方案（量化、bf16、编译、channels_last）的速度和与 fp32 的误差")
+    parser.add_argument("--cpu-variants", nargs="+", default=list(cpu_variants), choices=list(cpu_variants))
+    parser.add_argument("--pretrained", action="store_true", help="使用预训练模型，误差结果更有参考价值")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="比较预加载和按需加载时的就绪时间、第一次请求耗时，以及模型冷启动和重新加载的耗时")
+    parser.add_argument("--frontend-report", action="store_true",
+                        help="只测试音频前端（解码、重采样、whisper log-mel）每秒音频的耗时")
+    parser.add_argument("--frontend-seconds", type=float, nargs="+", default=[5, 30, 120])
+    parser.add_argument("--memory-report", action="store_true",
+                        help="比较不同文本长度下的进程内存峰值，每个长度在单独的进程中运行")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "seed_vc_edge_tts_benchmark"))
+    parser.add_argument("--output", help="保存结果的 JSON 文件")
+    parser.add_argument("--baseline", help="与之前保存的结果比较，变慢超过 --tolerance 时返回非零")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.memory_report:
+        memory_report(args)
+        return
+    if args.startup_report:
+        startup_report(args)
+        return
+    if args.frontend_report:
+        vc.device = torch.device(args.device)
+        frontend_report(args)
+        return
+    reference = setup_environment(args)
+    if reference is None:
+        return
+    if args.cpu_report:
+        cpu_report(args, reference)
+        return
+
+    results = []
+    for f0_condition in [bool(f) for f in args.f0_condition]:
+        # 预热：加载模型并缓存参考音色，不计入结果
+        run_once(sample_text, reference, args.diffusion_steps[0], f0_condition, args.stream_format)
+        for text_length in args.text_lengths:
+            text = (sample_text * (text_length // len(sample_text) + 1))[:text_length]
+            for diffusion_steps in args.diffusion_steps:
+                runs = [run_once(text, reference, diffusion_steps, f0_condition, args.stream_format)
+                        for _ in range(args.repeat)]
+                stage_names = sorted({stage for run in runs for stage in run["stages"]})
+                result = {
+                    "text_chars": text_length,
+                    "diffusion_steps": diffusion_steps,
+                    "f0_condition": f0_condition,
+                    "audio_seconds": runs[0]["audio_seconds"],
+                    "total_time": float(np.median([run["total_time"] for run in runs])),
+                    "time_to_first_chunk": float(np.median([run["time_to_first_chunk"] for run in runs])),
+                    "rtf": float(np.median([run["rtf"] for run in runs])),
+                    "stages": {stage: float(np.median([run["stages"].get(stage, 0.0) for run in runs]))
+                               for stage in stage_names},
+                    "memory_delta_mb": max(max(run["memory_delta_mb"].values(), default=0) for run in runs),
+                }
+                results.append(result)
+                top_stages = sorted(result["stages"].items(), key=lambda x: -x[1])[:4]
+                print(f"[bench] chars={text_length:4d} steps={diffusion_steps:3d} f0={int(f0_condition)} "
+                      f"audio={result['audio_seconds']:6.2f}s total={result['total_time']:.3f}s "
+                      f"first_chunk={result['time_to_first_chunk']:.3f}s rtf={result['rtf']:.3f} "
+                      + " ".join(f"{k}={v:.3f}" for k, v in top_stages))
+
+    print(f"[bench] edge_tts {vc.edge_tts_client.stats()}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"device": args.device, "torch": torch.__version__, "time": time.time(), "results": results},
+                      f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"[bench] regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("[bench] no regressions")
+
+
+if __name__ == "__main__":
+    main()
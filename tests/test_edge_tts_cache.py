@@ -0,0 +1,23 @@
+import os
+
+import seed_vc_edge_tts as vc
+
+
+def test_memory_hit_after_disk_eviction(tmp_path):
+    # 磁盘上限小于内存上限：文件被删除后仍从内存返回
+    cache = vc.EdgeTTSCache(10_000, str(tmp_path), 0)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    assert not os.path.exists(cache.path("a"))
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("b") == b"b" * 100
+
+
+def test_disk_hit_after_restart(tmp_path):
+    cache = vc.EdgeTTSCache(10_000, str(tmp_path), 150)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    restarted = vc.EdgeTTSCache(10_000, str(tmp_path), 150)
+    assert restarted.get("a") is None
+    assert restarted.get("b") == b"b" * 100
+    assert restarted.disk_bytes == 100